@@ -5,16 +5,71 @@ Created on Sun Jun 14 18:43:35 2020
 @author: lizan
 """
 
-import tkinter as tk
-from tkinter.filedialog import askopenfilename
-import pptx
-from nltk import sent_tokenize
-import requests
-
 from abc import ABC, abstractmethod
 import re
 from copy import copy
 import os
+import argparse
+import array
+import base64
+import bisect
+import difflib
+import functools
+import glob
+import hashlib
+import importlib
+import itertools
+import json
+import mmap
+import multiprocessing
+import posixpath
+import queue
+import random
+import shutil
+import sqlite3
+import struct
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+
+class LazyModule:
+    '''
+    Imports the module on the first access to its attributes.
+    Heavy dependencies (GUI, python-pptx, NLTK, requests) are loaded
+    only by the code paths which use them
+    '''
+    
+    def __init__(self, name):
+        self.__name = name
+        self.__module = None
+        
+    def __getattr__(self, attribute):
+        if self.__module is None:
+            self.__module = importlib.import_module(self.__name)
+        return getattr(self.__module, attribute)
+
+
+tk = LazyModule('tkinter')
+filedialog = LazyModule('tkinter.filedialog')
+pptx = LazyModule('pptx')
+pptx_group = LazyModule('pptx.shapes.group')
+nltk = LazyModule('nltk')
+requests = LazyModule('requests')
+
+
+def sent_tokenize(text, language):
+    return nltk.sent_tokenize(text, language)
+
+
+SPELLING_ASPECT = 'Проверка орфографии'
+TYPOGRAPHY_ASPECT = 'Проверка типографского оформления'
+ALL_ASPECTS = [SPELLING_ASPECT, TYPOGRAPHY_ASPECT]
 
 class PrintOutputDecorator:
     '''
@@ -33,6 +88,108 @@ class PrintOutputDecorator:
             return foo_output
         return wrapped_f
 
+
+class Metrics:
+    '''
+    Collects wall time of the stages and counters (characters, requests,
+    bytes, retries, cache hits, problems). Nothing is recorded while
+    enabled is False, so the switched off instrumentation costs
+    one attribute check per call.
+    '''
+    
+    PROMETHEUS_PREFIX = 'pptxchecker_'
+    
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.__lock = threading.Lock()
+        self.reset()
+        
+    def reset(self):
+        with self.__lock:
+            self.stages = {}
+            self.counters = {}
+        
+    def observe(self, stage, seconds):
+        if self.enabled:
+            with self.__lock:
+                calls, total = self.stages.get(stage, (0, 0.0))
+                self.stages[stage] = (calls + 1, total + seconds)
+                
+    def add(self, counter, value=1):
+        if self.enabled:
+            with self.__lock:
+                self.counters[counter] = self.counters.get(counter, 0) + value
+                
+    def snapshot(self):
+        '''
+        Returns the collected data as plain dicts (can be sent between
+        the processes and saved as JSON)
+        '''
+        with self.__lock:
+            return {'stages': {stage: {'calls': calls, 'seconds': total}
+                               for stage, (calls, total) in self.stages.items()},
+                    'counters': dict(self.counters)}
+    
+    def merge(self, snapshot):
+        '''
+        Adds a snapshot made in another process
+        '''
+        with self.__lock:
+            for stage, data in snapshot['stages'].items():
+                calls, total = self.stages.get(stage, (0, 0.0))
+                self.stages[stage] = (calls + data['calls'], total + data['seconds'])
+            for counter, value in snapshot['counters'].items():
+                self.counters[counter] = self.counters.get(counter, 0) + value
+                
+    def to_prometheus(self):
+        '''
+        Returns the data in Prometheus text exposition format
+        '''
+        snapshot = self.snapshot()
+        prefix = self.PROMETHEUS_PREFIX
+        lines = ['# TYPE {}stage_seconds_total counter'.format(prefix)]
+        lines += ['{}stage_seconds_total{{stage="{}"}} {}'.format(prefix, stage, data['seconds'])
+                  for stage, data in sorted(snapshot['stages'].items())]
+        lines.append('# TYPE {}stage_calls_total counter'.format(prefix))
+        lines += ['{}stage_calls_total{{stage="{}"}} {}'.format(prefix, stage, data['calls'])
+                  for stage, data in sorted(snapshot['stages'].items())]
+        for counter, value in sorted(snapshot['counters'].items()):
+            name = prefix + re.sub(r'\W', '_', counter) + '_total'
+            lines.append('# TYPE {} counter'.format(name))
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
+    
+    def save(self, json_path=None, prometheus_path=None):
+        if json_path:
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+        if prometheus_path:
+            with open(prometheus_path, 'w', encoding='utf-8') as f:
+                f.write(self.to_prometheus())
+
+
+METRICS = Metrics()
+
+
+class TimedDecorator:
+    '''
+    Decorator, which adds the wall time of the function to METRICS
+    '''
+    
+    def __init__(self, stage):
+        self.stage = stage
+        
+    def __call__(self, foo):
+        def wrapped_f(*args, **kwargs):
+            if not METRICS.enabled:
+                return foo(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return foo(*args, **kwargs)
+            finally:
+                METRICS.observe(self.stage, time.perf_counter() - start)
+        return wrapped_f
+
     
 class AbstractCheckerRoot(ABC): 
     '''
@@ -82,19 +239,27 @@ class AbstractCheckerRoot(ABC):
         self._aspects_choice_window.mainloop()
         
     def _start_checking(self):
+        '''
+        The file is checked in the background, the problems are shown
+        as soon as they are found
+        '''
         self._aspects_choice_window.destroy()
         checker_manager = AspectCheckerManager()
         chosen_aspects = self.__chosen_aspects()
-        checker_manager.set_problems(self.chosen_file, chosen_aspects)
+        self.chosen_file.manifest = CheckManifest.for_file(self.file_path,
+                                                           checker_manager.config_key())
+        self.chosen_file.decisions = Decisions.for_file(self.file_path)
+        self.checking = BackgroundCheck(checker_manager, self.chosen_file, chosen_aspects,
+                                        self.chosen_file.manifest).start()
         self._show_options()
     
     @PrintOutputDecorator('Вы выбрали аспекты проверки:')
     def __chosen_aspects(self):
         chosen_aspects = []
         if self.__check_spelling.get():
-            chosen_aspects.append('Проверка орфографии')
+            chosen_aspects.append(SPELLING_ASPECT)
         if self.__check_typography.get():
-            chosen_aspects.append('Проверка типографского оформления')
+            chosen_aspects.append(TYPOGRAPHY_ASPECT)
         return chosen_aspects
     
     @abstractmethod
@@ -115,8 +280,8 @@ class PptxCheckerRoot(AbstractCheckerRoot):
         '''
         filetypes=[('Презентация Microsoft PowerPoint', '.pptx')]
         title = 'Выберите презентацию в формате .pptx для проверки'
-        return askopenfilename(filetypes=filetypes,
-                               title = title)
+        return filedialog.askopenfilename(filetypes=filetypes,
+                                          title = title)
     
     def _open_file(self):
         '''
@@ -131,68 +296,107 @@ class PptxCheckerRoot(AbstractCheckerRoot):
         '''
         #self.checker_root.destroy()
         self.problems_window = PptxProblemsWindowCreator(self.checker_root,
-                                                         self.chosen_file)
+                                                         self.chosen_file,
+                                                         self.checking)
         
        
 class SingleProblemAsker:
     '''
-    The class places single problem data at the window.
-    Stores the reference to the object with problem data.
+    A row of the problems window: a label and radiobuttons with
+    the options. The rows are reused while scrolling, the shown
+    problem is changed by show_problem / show_header.
+    The choice is passed to on_choice(choice)
     '''
-    def __init__(self, problem, window, start_row):
-        self.problem = problem
-        
-        self.text = tk.Label(window, text=self.problem['text_to_show'],
-                             justify='left')
-        self.text.grid(row=start_row)
-        options = self.problem['options']
+    def __init__(self, window, start_row, max_options, on_choice):
+        self.on_choice = on_choice
+        self.window = window
+        self.start_row = start_row
+        self.text = tk.Label(window, justify='left', anchor='w', wraplength=700)
+        self.text.grid(row=start_row, column=0, columnspan=max_options, sticky='w')
         self.var = tk.IntVar()
-        self.var.set(0)
-        for i, option in enumerate(options):
-            radiobutton = tk.Radiobutton(window, text=options[i],
-                                         variable = self.var, value=i)
-            if i == 0:
-                radiobutton.select()
-            radiobutton.grid(row=start_row+1, column=i)
+        self.radiobuttons = []
+        for i in range(max_options):
+            self.__add_radiobutton()
+            
+    def __add_radiobutton(self):
+        radiobutton = tk.Radiobutton(self.window, variable=self.var,
+                                     value=len(self.radiobuttons), command=self.__choose)
+        radiobutton.grid(row=self.start_row+1, column=len(self.radiobuttons), sticky='w')
+        self.radiobuttons.append(radiobutton)
+        self.text.grid(columnspan=len(self.radiobuttons))
+            
+    def show_header(self, text):
+        self.text.configure(text=text)
+        for radiobutton in self.radiobuttons:
+            radiobutton.grid_remove()
+    
+    def show_problem(self, problem, choice):
+        self.text.configure(text=problem['text_to_show'])
+        options = problem['options']
+        while len(self.radiobuttons) < len(options): ##The rows may come after the start
+            self.__add_radiobutton()
+        for i, radiobutton in enumerate(self.radiobuttons):
+            if i < len(options):
+                radiobutton.configure(text=options[i])
+                radiobutton.grid()
+            else:
+                radiobutton.grid_remove()
+        self.var.set(choice)
         
-    def add_choice(self):
-        '''
-        The method interpretes Tkinter variables and adds key 'choice'
-        to the corresponding dictionary
-        '''
-        try:
-            self.problem['choice'] = self.var.get()
-        except ProtectedKeyException:
-            pass       
+    def hide(self):
+        self.text.configure(text='')
+        for radiobutton in self.radiobuttons:
+            radiobutton.grid_remove()
+        
+    def __choose(self):
+        self.on_choice(self.var.get())
 
 
 class AbsractProblemsWindowCreator():
     
     '''
     The class organizes showing the problems and options to the user
-    and collecting his choice data
+    and collecting his choice data.
+    The problems and the choices are stored in lists (self.rows,
+    self.choices), only PAGE_SIZE rows of widgets are created and
+    filled with the rows visible at the moment.
+    If checking (BackgroundCheck) is given, the file is still being checked:
+    the problems are added as they come, the correction is possible
+    when the checking is finished or cancelled
     '''
-    def __init__(self, root, prepared_object):
+    PAGE_SIZE = 12
+    POLL_INTERVAL = 100 ##ms
+    
+    def __init__(self, root, prepared_object, checking=None):
         self.window = tk.Toplevel(root)
-        self.start_row = 0
+        self.rows = []
+        self.choices = []
+        self.first_row = 0
         self.single_askers = []
+        self.checking = checking
+        self.texts_done = 0
+        self.__poll_id = None ##The pending Tk timer of __poll_checking
         self.__correction_started = False
         self.collect_user_choises(prepared_object)
         self.window.mainloop()
         
+    def _show_header(self, text):
+        '''
+        Adds a row with a comment (e.g. about the location of the next problems)
+        '''
+        self.rows.append(text)
+        self.choices.append(None)
         
     def _show_problems(self, found_problems):
         '''
-        Input - list of dictionaries.
-        Method creates a SingleProblemAsker for each problem
+        Input - list of problems.
+        Adds a row for each problem, the chosen option is the saved one
+        or the first one
         '''
         for problem in found_problems:
-            problem_asker = SingleProblemAsker(problem, self.window,
-                                               self.start_row)
-            self.single_askers.append(problem_asker)
-            self.start_row += 2
+            self.rows.append(problem)
+            self.choices.append(problem.get('choice', 0))
             
-                
     @abstractmethod       
     def _show_file_problems(self, prepared_object):
         '''
@@ -201,23 +405,139 @@ class AbsractProblemsWindowCreator():
         '''
         pass
     
+    @abstractmethod
+    def _show_texts_problems(self, first_text, texts_problems):
+        '''
+        Shows the problems of the next checked texts
+        '''
+        pass
+    
+    @abstractmethod
+    def _progress_text(self):
+        '''
+        Describes how much of the file is checked
+        '''
+        pass
+    
     def collect_user_choises(self, prepared_object):
         '''
         Organizes all the process of collecting user choices
         '''
         self.prepared_object = prepared_object
-        self._show_file_problems(prepared_object)
-        choice_button = tk.Button(self.window, text = 'Внести исправления',
-                                  command=self.__prepare_data_to_correct)
-        choice_button.grid(row=self.start_row)
+        if self.checking is None:
+            self._show_file_problems(prepared_object)
+            page_size = min(self.PAGE_SIZE, len(self.rows))
+        else:
+            page_size = self.PAGE_SIZE
+        ## Options are the replacements and at most two extra options
+        max_options = max([len(row['s']) + 2 for row, choice
+                           in zip(self.rows, self.choices) if choice is not None] + [1])
+        rows_frame = tk.Frame(self.window)
+        rows_frame.grid(row=0, column=0, sticky='nw')
+        for i in range(page_size):
+            asker = SingleProblemAsker(rows_frame, 2*i, max_options,
+                                       functools.partial(self.__store_choice, i))
+            self.single_askers.append(asker)
+        self.scrollbar = tk.Scrollbar(self.window, orient='vertical',
+                                      command=self.__scroll)
+        self.scrollbar.grid(row=0, column=1, sticky='ns')
+        self.window.bind('<MouseWheel>', self.__scroll_wheel)
+        self.window.bind('<Button-4>', lambda event: self.__scroll_to(self.first_row-1))
+        self.window.bind('<Button-5>', lambda event: self.__scroll_to(self.first_row+1))
+        self.choice_button = tk.Button(self.window, text = 'Внести исправления',
+                                       command=self.__prepare_data_to_correct)
+        self.choice_button.grid(row=2, column=0)
+        if self.checking is not None:
+            self.progress = tk.Label(self.window, anchor='w')
+            self.progress.grid(row=1, column=0, sticky='w')
+            self.cancel_button = tk.Button(self.window, text='Остановить проверку',
+                                           command=self.checking.cancel)
+            self.cancel_button.grid(row=2, column=1)
+            self.choice_button.configure(state='disabled')
+            self.window.protocol('WM_DELETE_WINDOW', self.__close)
+            self.__poll_checking()
+        self.__scroll_to(0)
+        
+    def __poll_checking(self):
+        '''
+        Takes the results of the background checking, repeated by the Tk timer
+        '''
+        self.__poll_id = None
+        finished = False
+        result = None
+        for kind, data in self.checking.take_events():
+            if kind == 'texts':
+                first_text, texts_problems = data
+                self._show_texts_problems(first_text, texts_problems)
+                self.texts_done = first_text + len(texts_problems)
+            else:
+                finished, result = True, data
+        self.__scroll_to(self.first_row)
+        if not finished:
+            self.progress.configure(text=self._progress_text())
+            self.__poll_id = self.window.after(self.POLL_INTERVAL, self.__poll_checking)
+            return
+        if result is None:
+            self.progress.configure(text='Проверка завершена. ' + self._progress_text())
+        elif result == 'cancelled':
+            self.progress.configure(text='Проверка остановлена. ' + self._progress_text())
+        else:
+            self.progress.configure(text='Ошибка проверки: ' + result)
+        self.cancel_button.configure(state='disabled')
+        self.choice_button.configure(state='normal')
+        self.checking = None
+        
+    def __close(self):
+        if self.__poll_id is not None:
+            self.window.after_cancel(self.__poll_id)
+        if self.checking is not None:
+            self.checking.cancel()
+        self.window.destroy()
+        
+    def __scroll_to(self, first_row):
+        '''
+        Fills the widgets with the rows starting from first_row
+        '''
+        last_first_row = max(0, len(self.rows) - len(self.single_askers))
+        self.first_row = min(max(0, first_row), last_first_row)
+        for i, asker in enumerate(self.single_askers):
+            index = self.first_row + i
+            if index >= len(self.rows):
+                asker.hide()
+            elif self.choices[index] is None:
+                asker.show_header(self.rows[index])
+            else:
+                asker.show_problem(self.rows[index], self.choices[index])
+        if self.rows:
+            self.scrollbar.set(self.first_row / len(self.rows),
+                               min(1, (self.first_row + len(self.single_askers)) / len(self.rows)))
+            
+    def __scroll(self, action, amount, unit=None):
+        '''
+        Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'/'pages')
+        '''
+        if action == 'moveto':
+            self.__scroll_to(int(float(amount) * len(self.rows)))
+        elif unit == 'pages':
+            self.__scroll_to(self.first_row + int(amount)*len(self.single_askers))
+        else:
+            self.__scroll_to(self.first_row + int(amount))
+            
+    def __scroll_wheel(self, event):
+        self.__scroll_to(self.first_row - (1 if event.delta > 0 else -1))
+        
+    def __store_choice(self, asker_id, choice):
+        index = self.first_row + asker_id
+        if self.choices[index] is not None: ##Headers have no choice
+            self.choices[index] = choice
     
     def __prepare_data_to_correct(self):
         '''
-        For each single problem asker calls the method which adds
-        the user choice data to the problem dict
+        Adds the user choice data to each problem
         '''
-        for asker in self.single_askers:
-            asker.add_choice()
+        for problem, choice in zip(self.rows, self.choices):
+            if choice is not None:
+                problem.review(choice)
         self.__correct()
             
     def __correct(self):
@@ -232,24 +552,56 @@ class AbsractProblemsWindowCreator():
             
 class PptxProblemsWindowCreator(AbsractProblemsWindowCreator):
     
+    def __init__(self, root, prepared_pptx, checking=None):
+        self._prev_slide_id = -1 ##The slide of the last shown header
+        self._text_slides = None
+        super().__init__(root, prepared_pptx, checking)
+    
     def _show_file_problems(self, prepared_pptx):
         '''
         Shows problems data and comments about the presentation
         slides numbers
         '''
-        prev_slide_id = -1
-        problems = prepared_pptx.problems_to_show()
-        for index, shape_problems in enumerate(problems):
-            current_slide_id = shape_problems[1]
+        self._show_texts_problems(0, [shape_problems[0] for shape_problems
+                                      in prepared_pptx.problems_to_show()])
+        
+    def _show_texts_problems(self, first_text, texts_problems):
+        prev_slide_id = self._prev_slide_id
+        slides = self.__text_slides()
+        for index, shape_problems in enumerate(texts_problems, first_text):
+            current_slide_id = slides[index]
             if current_slide_id > prev_slide_id:
-                text = 'СЛАЙД '+str(current_slide_id+1)
-                bondary_label = tk.Label(self.window, text = text)
-                bondary_label.grid(row=self.start_row)
-                self.start_row +=1
+                self._show_header('СЛАЙД '+str(current_slide_id+1))
                 prev_slide_id = current_slide_id
-            if shape_problems[0]:
-                shape_found_problems = shape_problems[0]
-                self._show_problems(shape_found_problems)
+            if shape_problems:
+                self._show_problems(shape_problems)
+        self._prev_slide_id = prev_slide_id
+        
+    def _progress_text(self):
+        slides = self.__text_slides()
+        slides_count = len(set(slide for slide in slides if slide >= 0))
+        ## The slides before the slide of the next text are checked
+        ## (the templates, slide -1, are after all the slides)
+        next_slide = slides[self.texts_done] if self.texts_done < len(slides) else -1
+        slides_done = len(set(slide for slide in slides[:self.texts_done]
+                              if slide >= 0 and (next_slide < 0 or slide < next_slide)))
+        text = 'Проверено слайдов: {} из {}, текстов: {} из {}'.format(
+            slides_done, slides_count, self.texts_done, len(slides))
+        if self.checking is not None:
+            text += ', запросов в работе: {}'.format(self.checking.requests_in_flight())
+        return text
+    
+    def __text_slides(self):
+        '''
+        Slide index of each text, -1 for the templates
+        '''
+        if self._text_slides is None:
+            self._text_slides = []
+        ## The locations of a streaming file grow while it is read
+        locations = self.prepared_object.text_locations()
+        self._text_slides += [-1 if location['slide'] is None else location['slide']
+                              for location in locations[len(self._text_slides):]]
+        return self._text_slides
             
             
 class AbstractFileChecker(ABC):
@@ -260,11 +612,12 @@ class AbstractFileChecker(ABC):
     stores checkers output(set_texts_problems, set_headers_problems)
     '''
     
+    @TimedDecorator('load')
     def __init__(self, file_path):
         self.file_path = file_path
         self._content = self._read_file(self.file_path)
         self._get_all_texts()
-        self.__is_corrected = False
+        self.manifest = None
     
     @abstractmethod
     def _read_file(self, file_path):
@@ -280,6 +633,13 @@ class AbstractFileChecker(ABC):
         into a list of strings
         '''
         pass   
+    
+    def iter_texts_to_checker(self):
+        '''
+        Yields the same texts as texts_to_checker. The checkers, which
+        take the texts by chunks, can start before all the texts are read
+        '''
+        return iter(self.texts_to_checker())
      
     @abstractmethod    
     def set_texts_problems(self, texts_problems):
@@ -296,30 +656,54 @@ class AbstractFileChecker(ABC):
         '''
         pass
     
-    def __correct_single_problem(self, text, problem): 
+    
+class AbstractCorrectableFileChecker(AbstractFileChecker):
+    '''
+    The file checker, which also corrects the file: makes the chosen
+    corrections and saves the corrected copy
+    '''
+    
+    def __init__(self, file_path):
+        super().__init__(file_path)
+        self.__is_corrected = False
+        self.decisions = None
+        self.corrected_path = None
+    
+    def _correct_single_text_problems(self, text, problems):
         '''
-        Substitude mistakes in the text with chosen correction option.
+        Substitude mistakes in the text with chosen correction options.
+        The corrected text is built in one pass from the fragments between
+        the problems. A problem without choice or with the last choice
+        ('do not correct') is skipped, so is a problem overlapping
+        the previous corrected one
         '''
-        if problem['choice'] == len(problem['s']): ##The last option is always
-            pass                                   ## 'do not correct'
-        else:
-            if (problem['pos'] + problem['len']) < len(text):
-                post_part = text[problem['pos']+problem['len']:] 
-            else: ###If the mistake is in the last symbol
-                post_part = '' ##the post_part should be ''
-            text = text[:problem['pos']] + problem['s'][problem['choice']] + post_part
-        return(text)
+        fragments = []
+        end = 0
+        for pos, length, replacement in self._chosen_corrections(problems):
+            fragments.append(text[end:pos])
+            fragments.append(replacement)
+            end = pos + length
+        if not fragments:
+            return text
+        fragments.append(text[end:])
+        return ''.join(fragments)
     
-    def _correct_single_text_problems(self, text, problems):
+    def _chosen_corrections(self, problems):
         '''
-        Sorts the problems by pos decrising and corrects it.
-        No overlaping of fragments to substitute should be guatanteed.
+        Returns the corrections to make: a sorted list of (position, length,
+        replacement), see _correct_single_text_problems
         '''
-        problems.sort(key = lambda x: x['pos'], reverse=True)
-        for problem in problems:
-            text = self.__correct_single_problem(text, problem)
-        return text
+        corrections = []
+        end = 0
+        for problem in sorted(problems, key=lambda x: x['pos']):
+            choice = problem.get('choice', len(problem['s']))
+            if choice >= len(problem['s']) or problem['pos'] < end:
+                continue
+            corrections.append((problem['pos'], problem['len'], problem['s'][choice]))
+            end = problem['pos'] + problem['len']
+        return corrections
         
+    @TimedDecorator('correct')
     def correct(self):
         '''
         Corrects content if it has not been corrected yet and saves it
@@ -327,7 +711,13 @@ class AbstractFileChecker(ABC):
         if self.__is_corrected == False:
             self._correct_content()
             self.__is_corrected = True
-            self._save_content(self.__get_default_new_file_name())
+            self.corrected_path = self.__get_default_new_file_name()
+            self._save_content(self.corrected_path)
+            if self.manifest is not None: ##Saves the user choices
+                self.manifest.save()
+            if self.decisions is not None:
+                self.decisions.record_file(self)
+                self.decisions.save()
         
         
     @abstractmethod   
@@ -349,26 +739,79 @@ class AbstractFileChecker(ABC):
         return name_parts[0] + '_corrected'+ name_parts[1]
         
 
-class PptxChecker(AbstractFileChecker):
+class PptxChecker(AbstractCorrectableFileChecker):
+    '''
+    Checks the texts of the shapes (including the shapes in groups),
+    table cells and speaker notes; with include_templates also the texts
+    of slide masters and layouts. Each text has a location
+    (text_locations), e.g. {'slide': 0, 'kind': 'table', 'shape_id': 4,
+    'row': 1, 'col': 2}.
+    With fast_save only the corrected parts are written anew,
+    the other parts of the package are copied without recompression.
+    The corrections are made in the runs of the text, so the formatting
+    and the other runs are kept
+    '''
+    
+    RUN_TAG = '{http://schemas.openxmlformats.org/drawingml/2006/main}r'
+    
+    def __init__(self, file_path, fast_save=True, include_templates=False):
+        self.fast_save = fast_save
+        self.include_templates = include_templates
+        self.__corrected_parts = set()
+        super().__init__(file_path)
     
     def _read_file(self, file_path):
         with open(file_path, 'rb') as f:
             return pptx.Presentation(f)
 
     def _get_all_texts(self):
-        texts = []
-        shapes = []
+        '''
+        Collects the texts with their containers (objects with
+        the attribute text) and the parts containing them
+        '''
+        self.__texts = []
+        self.__containers = []
         for index, slide in enumerate(self._content.slides):
-            for shape in slide.shapes:
-                if shape.has_text_frame:
-                    texts.append([shape.text, index])
-                    shapes.append(shape)
-        self.__shapes = shapes
-        self.__texts = texts
+            self.__add_shapes(slide.shapes, index, {'slide': index})
+            if slide.has_notes_slide:
+                notes = slide.notes_slide.notes_text_frame
+                if notes is not None:
+                    self.__add_text(notes, slide.notes_slide.part, index,
+                                    {'slide': index, 'kind': 'notes'})
+        if self.include_templates:
+            for master in self._content.slide_masters:
+                for template in [master] + list(master.slide_layouts):
+                    self.__add_shapes(template.shapes, -1,
+                                      {'slide': None, 'part': str(template.part.partname)})
+                    
+    def __add_shapes(self, shapes, slide_index, location):
+        for shape in shapes:
+            shape_location = dict(location, shape_id=shape.shape_id)
+            ## shape_type raises NotImplementedError for the shapes without
+            ## a geometry and the unknown ones (e.g. ink), so it is not used
+            if isinstance(shape, pptx_group.GroupShape):
+                self.__add_shapes(shape.shapes, slide_index, location)
+            elif shape.has_table:
+                for row_id, row in enumerate(shape.table.rows):
+                    for col_id, cell in enumerate(row.cells):
+                        if not cell.is_spanned:
+                            self.__add_text(cell, shape.part, slide_index,
+                                            dict(shape_location, kind='table',
+                                                 row=row_id, col=col_id))
+            elif shape.has_text_frame:
+                self.__add_text(shape, shape.part, slide_index,
+                                dict(shape_location, kind='shape'))
+                
+    def __add_text(self, container, part, slide_index, location):
+        self.__texts.append([container.text, slide_index, location])
+        self.__containers.append((container, part))
         
     def texts_to_checker(self):
         return [copy(text[0]) for text in self.__texts]
     
+    def text_locations(self):
+        return [text[2] for text in self.__texts]
+    
     def set_texts_problems(self, texts_problems):
         self.__texts_problems = [[texts_problems[i], self.__texts[i][1]]
         for i, text in enumerate(self.__texts)]     
@@ -380,13 +823,392 @@ class PptxChecker(AbstractFileChecker):
         for index, text in enumerate(self.__texts):
             text_problems = self.__texts_problems[index][0]
             if text_problems:
-                new_text = self._correct_single_text_problems(text[0],
-                                                              text_problems)
-                self.__shapes[index].text = new_text
+                corrections = self._chosen_corrections(text_problems)
+                if not corrections:
+                    continue
+                container, part = self.__containers[index]
+                if not self.__correct_runs(container, text[0], corrections):
+                    container.text = self._correct_single_text_problems(text[0],
+                                                                        text_problems)
+                self.__corrected_parts.add(part)
+                
+    def __text_map(self, container, text):
+        '''
+        Maps the positions in the text of the container to its runs:
+        a list of (start, end, run element), the run element is None for
+        line breaks and fields. The '\n' between paragraphs belongs to no run.
+        Returns None if the text of the runs differs from text
+        '''
+        text_frame = getattr(container, 'text_frame', container)
+        segments = []
+        pieces = []
+        pos = 0
+        for paragraph_id, paragraph in enumerate(text_frame.paragraphs):
+            if paragraph_id:
+                pieces.append('\n')
+                pos += 1
+            for element in paragraph._element.content_children:
+                element_text = element.text
+                run = element if element.tag == self.RUN_TAG else None
+                segments.append((pos, pos + len(element_text), run))
+                pieces.append(element_text)
+                pos += len(element_text)
+        if ''.join(pieces) != text:
+            return None
+        return segments
+    
+    def __correct_runs(self, container, text, corrections):
+        '''
+        Makes the corrections in the runs containing them, the other runs
+        are not changed. A correction of several runs is written to the first
+        of them. Returns False (nothing is changed) if a correction touches
+        a line break, a field or the end of a paragraph
+        '''
+        segments = self.__text_map(container, text)
+        if segments is None:
+            return False
+        ends = [end for start, end, run in segments]
+        patches = []
+        for pos, length, replacement in corrections:
+            first = bisect.bisect_right(ends, pos)
+            last = first
+            while last < len(segments) and segments[last][1] < pos + length:
+                last += 1
+            covered = segments[first:last + 1]
+            if (last >= len(segments) or covered[0][0] > pos
+                    or any(run is None for start, end, run in covered)
+                    or any(covered[i][0] != covered[i-1][1] for i in range(1, len(covered)))):
+                return False
+            patches.append((pos, length, replacement, covered))
+        ## From the end, so the positions of the previous corrections stay valid
+        for pos, length, replacement, covered in reversed(patches):
+            for i, (start, end, run) in enumerate(covered):
+                run_text = run.text
+                head = run_text[:pos - start] if i == 0 else ''
+                tail = run_text[pos + length - start:] if i == len(covered) - 1 else ''
+                run.text = head + (replacement if i == 0 else '') + tail
+        return True
             
+    @TimedDecorator('save')
     def _save_content(self, new_file_name):
-        self._content.save(new_file_name)
+        if not self.fast_save:
+            self._content.save(new_file_name)
+            return
+        ## python-pptx renames the slide parts in memory, so their names
+        ## are taken from the original package
+        with PptxXmlReader(self.file_path) as reader:
+            slide_parts = reader.slide_parts()
+        part_names = {slide.part: slide_parts[index]
+                      for index, slide in enumerate(self._content.slides)}
+        new_parts = {part_names.get(part, str(part.partname).lstrip('/')): part.blob
+                     for part in self.__corrected_parts}
+        copy_zip_with_replaced_parts(self.file_path, new_file_name, new_parts)
+        
+
+## The private attributes of zipfile.ZipFile used by _copy_raw_zip_entry
+ZIP_INTERNALS = ('fp', 'filelist', 'NameToInfo', 'start_dir')
+
+
+def copy_zip_with_replaced_parts(source_path, target_path, new_parts):
+    '''
+    Copies the zip archive. The entries from new_parts (dict name: bytes)
+    are compressed and written anew, all the other entries are copied
+    in compressed form, without decompression.
+    If zipfile has no internals needed for the raw copy (ZIP_INTERNALS),
+    the other entries are decompressed and compressed again
+    '''
+    with zipfile.ZipFile(source_path) as source, \
+         zipfile.ZipFile(target_path, 'w') as target:
+        raw_copy = all(hasattr(archive, name) for archive in (source, target)
+                       for name in ZIP_INTERNALS)
+        for info in source.infolist():
+            if info.filename in new_parts:
+                new_info = zipfile.ZipInfo(info.filename, info.date_time)
+                new_info.compress_type = zipfile.ZIP_DEFLATED
+                new_info.external_attr = info.external_attr
+                target.writestr(new_info, new_parts[info.filename])
+            elif raw_copy:
+                _copy_raw_zip_entry(source, target, info)
+            else:
+                target.writestr(info, source.read(info))
+
+
+def _copy_raw_zip_entry(source, target, info, chunk_size=1024*1024):
+    '''
+    Writes the local header and the compressed data of the entry
+    to the end of the target archive.
+    zipfile has no public API for it, so its file (fp) is used directly
+    and its bookkeeping (filelist, NameToInfo, start_dir) is updated here.
+    They are not a public API, so copy_zip_with_replaced_parts checks
+    that they exist before the raw copy
+    '''
+    source.fp.seek(info.header_offset)
+    header = source.fp.read(30)
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    source.fp.seek(info.header_offset + 30 + name_length + extra_length)
+    new_info = copy(info)
+    new_info.flag_bits &= ~0x08 ##CRC and sizes are known, no data descriptor
+    new_info.header_offset = target.fp.tell()
+    target.fp.write(new_info.FileHeader())
+    remaining = info.compress_size
+    while remaining:
+        chunk = source.fp.read(min(chunk_size, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile('Неожиданный конец файла ' + info.filename)
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    target.start_dir = target.fp.tell()
+
+
+class _MappedFile(mmap.mmap):
+    '''
+    mmap is used by zipfile as a file, which needs seekable()
+    (mmap has it since Python 3.13 only)
+    '''
+    def seekable(self):
+        return True
+
+
+class PptxXmlReader:
+    '''
+    Reads the texts of the slides straight from the .pptx package (zip)
+    without python-pptx. Only presentation.xml, the relationships and
+    the slide (notes, template) parts are parsed, media parts are never read.
+    The file can be mapped into memory (use_mmap) instead of being read.
+    '''
+    
+    NAMESPACES = {'p': 'http://schemas.openxmlformats.org/presentationml/2006/main',
+                  'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+                  'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+                  'rel': 'http://schemas.openxmlformats.org/package/2006/relationships'}
+    NOTES_RELATIONSHIP = ('http://schemas.openxmlformats.org/officeDocument/'
+                          '2006/relationships/notesSlide')
+    
+    def __init__(self, file_path, use_mmap=False):
+        self.file_path = file_path
+        self.__file = open(file_path, 'rb')
+        self.__mmap = None
+        source = self.__file
+        if use_mmap:
+            self.__mmap = _MappedFile(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            source = self.__mmap
+        self.__zip = zipfile.ZipFile(source)
+        self.__names = set(self.__zip.namelist())
+        
+    def __relationships(self, part):
+        '''
+        Returns {relationship id: (type, target part name)} of the part
+        '''
+        directory, name = posixpath.split(part)
+        relationships_part = posixpath.join(directory, '_rels', name + '.rels')
+        if relationships_part not in self.__names:
+            return {}
+        relationships = {}
+        with self.__zip.open(relationships_part) as f:
+            for rel in ElementTree.parse(f).getroot():
+                if rel.get('TargetMode') == 'External':
+                    continue
+                target = rel.get('Target')
+                if target.startswith('/'):
+                    target = target[1:]
+                else:
+                    target = posixpath.normpath(posixpath.join(directory, target))
+                relationships[rel.get('Id')] = (rel.get('Type'), target)
+        return relationships
+    
+    def __listed_parts(self, part, list_path):
+        '''
+        Returns the names of the parts listed in the part
+        (e.g. the slides in p:sldIdLst of presentation.xml) in their order
+        '''
+        ns = self.NAMESPACES
+        relationships = self.__relationships(part)
+        with self.__zip.open(part) as f:
+            items = ElementTree.parse(f).getroot().findall(list_path, ns)
+        return [relationships[item.get('{%s}id' % ns['r'])][1] for item in items]
+        
+    def slide_parts(self):
+        '''
+        Returns the names of the slide parts in the order of the slides
+        '''
+        return self.__listed_parts('ppt/presentation.xml', 'p:sldIdLst/p:sldId')
+    
+    def template_parts(self):
+        '''
+        Returns the names of the slide masters, each followed by its layouts
+        '''
+        parts = []
+        for master in self.__listed_parts('ppt/presentation.xml',
+                                          'p:sldMasterIdLst/p:sldMasterId'):
+            parts.append(master)
+            parts += self.__listed_parts(master, 'p:sldLayoutIdLst/p:sldLayoutId')
+        return parts
+    
+    def iter_records(self, include_notes=True, include_templates=False):
+        '''
+        Lazily yields (location, text) for the shapes (including the shapes
+        in groups), table cells and speaker notes of the slides, optionally
+        for the masters and layouts. The locations are the same as
+        in PptxChecker.text_locations.
+        Paragraphs are joined with '\\n', line breaks are '\\v'
+        '''
+        for slide_index, part in enumerate(self.slide_parts()):
+            yield from self.__iter_part_texts(part, {'slide': slide_index})
+            if include_notes:
+                for relationship_type, notes_part in self.__relationships(part).values():
+                    if relationship_type == self.NOTES_RELATIONSHIP:
+                        yield from self.__iter_part_texts(notes_part, {'slide': slide_index},
+                                                          notes=True)
+        if include_templates:
+            for part in self.template_parts():
+                yield from self.__iter_part_texts(part, {'slide': None, 'part': '/' + part})
+    
+    def iter_texts(self):
+        '''
+        Lazily yields (slide_index, shape_id, text) for all the texts
+        of the slides (shape_id is None for the notes)
+        '''
+        for location, text in self.iter_records():
+            yield location['slide'], location.get('shape_id'), text
+                    
+    def __iter_part_texts(self, part, location, notes=False):
+        tree_depth = 0
+        with self.__zip.open(part) as f:
+            for event, element in ElementTree.iterparse(f, ('start', 'end')):
+                if event == 'start':
+                    tree_depth += 1
+                    continue
+                tree_depth -= 1
+                ## Children of spTree (cSld/spTree/...) are not needed after parsing
+                if tree_depth == 3:
+                    yield from self.__element_texts(element, location, notes)
+                    element.clear()
+                    
+    def __element_texts(self, element, location, notes):
+        ns = self.NAMESPACES
+        if element.tag == '{%s}grpSp' % ns['p']:
+            for child in element:
+                yield from self.__element_texts(child, location, notes)
+        elif element.tag == '{%s}sp' % ns['p']:
+            ## As in python-pptx, every shape has a text frame,
+            ## the text of a shape without txBody is empty
+            text_body = element.find('p:txBody', ns)
+            text = self.__body_text(text_body) if text_body is not None else ''
+            if notes:
+                ## The notes are in the body placeholder of the notes slide
+                if element.find("p:nvSpPr/p:nvPr/p:ph[@type='body']", ns) is not None:
+                    yield dict(location, kind='notes'), text
+                return
+            shape_id = int(element.find('p:nvSpPr/p:cNvPr', ns).get('id'))
+            yield dict(location, shape_id=shape_id, kind='shape'), text
+        elif element.tag == '{%s}graphicFrame' % ns['p'] and not notes:
+            table = element.find('a:graphic/a:graphicData/a:tbl', ns)
+            if table is None:
+                return
+            shape_id = int(element.find('p:nvGraphicFramePr/p:cNvPr', ns).get('id'))
+            for row_id, row in enumerate(table.findall('a:tr', ns)):
+                for col_id, cell in enumerate(row.findall('a:tc', ns)):
+                    if cell.get('hMerge') in ('1', 'true') or cell.get('vMerge') in ('1', 'true'):
+                        continue
+                    text_body = cell.find('a:txBody', ns)
+                    text = self.__body_text(text_body) if text_body is not None else ''
+                    yield dict(location, shape_id=shape_id, kind='table',
+                               row=row_id, col=col_id), text
+                    
+    def __body_text(self, text_body):
+        return '\n'.join(self.__paragraph_text(paragraph)
+                         for paragraph in text_body.findall('a:p', self.NAMESPACES))
+                
+    def __paragraph_text(self, paragraph):
+        ns = self.NAMESPACES
+        parts = []
+        for child in paragraph:
+            if child.tag in ('{%s}r' % ns['a'], '{%s}fld' % ns['a']):
+                parts.append(child.findtext('a:t', '', ns))
+            elif child.tag == '{%s}br' % ns['a']:
+                parts.append('\v')
+        return ''.join(parts)
+    
+    def close(self):
+        self.__zip.close()
+        if self.__mmap is not None:
+            self.__mmap.close()
+        self.__file.close()
+        
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+        
+
+class StreamingPptxChecker(AbstractFileChecker):
+    '''
+    Read-only checker of a .pptx file, which takes the texts from
+    PptxXmlReader instead of loading the whole presentation.
+    Stores only the texts, so the memory does not depend on the media size.
+    The texts are read lazily: iter_texts_to_checker reads the file only
+    as far as the texts are taken, so the checking of the first chunks
+    starts before the whole file is parsed
+    '''
+    
+    def __init__(self, file_path, use_mmap=False, include_templates=False):
+        self.use_mmap = use_mmap
+        self.include_templates = include_templates
+        super().__init__(file_path)
+    
+    def _read_file(self, file_path):
+        return PptxXmlReader(file_path, self.use_mmap)
+    
+    def _get_all_texts(self):
+        self.__texts = []
+        self.__locations = []
+        self.__unread = self.__read_records()
+        
+    def __read_records(self):
+        with self._content as reader:
+            yield from reader.iter_records(include_templates=self.include_templates)
+            
+    def __read_next(self):
+        '''
+        Reads the next text, returns False at the end of the file
+        '''
+        record = next(self.__unread, None)
+        if record is None:
+            return False
+        location, text = record
+        self.__texts.append([text, -1 if location['slide'] is None else location['slide'],
+                             location])
+        self.__locations.append(location)
+        return True
+        
+    def iter_texts_to_checker(self):
+        index = 0
+        while index < len(self.__texts) or self.__read_next():
+            yield self.__texts[index][0]
+            index += 1
+        
+    def texts_to_checker(self):
+        while self.__read_next():
+            pass
+        return [text[0] for text in self.__texts]
+    
+    def text_locations(self):
+        '''
+        The locations of the texts read so far, the list grows
+        while the texts are read
+        '''
+        return self.__locations
+    
+    def set_texts_problems(self, texts_problems):
+        self.__texts_problems = [[texts_problems[i], self.__texts[i][1]]
+        for i, text in enumerate(self.texts_to_checker())]
         
+    def problems_to_show(self):
+        return self.__texts_problems
+
 
 class AbstractAspectChecker(ABC):
     '''
@@ -399,12 +1221,21 @@ class AbstractAspectChecker(ABC):
         Output: a list of lists dictionaries, each list corresponds to one text,
         each dictionaty contains information about 1 problem
         '''
-        problems = self._check_texts(texts)
+        if METRICS.enabled:
+            stage = 'check_' + type(self).__name__
+            problems = TimedDecorator(stage)(self._check_texts)(texts)
+            METRICS.add(stage + '_chars', sum(len(text) for text in texts))
+            METRICS.add('problems_found', sum(len(text_problems)
+                                              for text_problems in problems))
+        else:
+            problems = self._check_texts(texts)
+        ## options and text_to_show are built on access, the sentences
+        ## of the texts are kept by the problems of this call
+        sentences = {}
         for i, single_text_problems in enumerate(problems):
             text = texts[i]
             for problem in single_text_problems:
-                problem['options'] = self._get_options(problem)
-                problem['text_to_show'] = self._get_text_to_show(text, problem)
+                problem.attach(self, text, sentences)
         return problems
     
     @abstractmethod
@@ -428,192 +1259,934 @@ class AbstractAspectChecker(ABC):
     
     def _get_sentences_with_id(self, text):
         '''
-        Splits text into shorter fragments
+        Splits text into shorter fragments.
+        Each sentence is searched after the previous one,
+        so the repeated sentences get their own positions
         '''
         if len(text) <= 70:
             return [{'sent': text, 'pos':0, 'end': len(text)-1}]
         else:
-            sents = sent_tokenize(text, 'russian')
-            return [{'sent': sent, 'pos': text.find(sent),
-                     'end': text.find(sent)+len(sent)-1} for sent in sents]
+            sents_with_index = []
+            search_start = 0
+            for sent in sent_tokenize(text, 'russian'):
+                pos = text.find(sent, search_start)
+                if pos == -1: ##The tokenizer may change the sentence a bit
+                    pos = search_start
+                sents_with_index.append({'sent': sent, 'pos': pos,
+                                         'end': pos+len(sent)-1})
+                search_start = pos + len(sent)
+            return sents_with_index
+    
+    def _get_sentences_index(self, text, cache=None):
+        '''
+        Returns the sentences and the list of their ends. Each text is split
+        once for the cache (a dict, find_problems gives a new one to the problems
+        of each call, so the calls do not share it)
+        '''
+        if cache is not None and text in cache:
+            return cache[text]
+        sents_with_index = self._get_sentences_with_id(text)
+        index = (sents_with_index, [sent['end'] for sent in sents_with_index])
+        if cache is not None:
+            cache[text] = index
+        return index
                
     def _get_text_to_show(self, text, problem):
         '''
         Matches a problem with a text fragment
         '''
-        sents_with_index = self._get_sentences_with_id(text)
-        current_sent_id = 0
-        current_sent = sents_with_index[current_sent_id]
-        while problem['pos'] > current_sent['end']:
-            current_sent_id += 1
-            current_sent = sents_with_index[current_sent_id]
-        return current_sent['sent']
+        sents_with_index, ends = self._get_sentences_index(text, problem._sentences)
+        current_sent_id = min(bisect.bisect_left(ends, problem['pos']),
+                              len(ends)-1)
+        return sents_with_index[current_sent_id]['sent']
     
 
 class ProtectedKeyException(Exception):
     def __init__(self, protected_key):
         self.text = 'Key '+protected_key+' cannot be overwrited'
 
-### Вообще-то без этого класса можно было бы легко обойтись (есть защита 
-### от повторного вызова исправления), но мне нужно было что-нибудь переопределить
-###
-        
-class DictWithProtectedKey(dict):
+class Problem:
     '''
-    Dict with a key, which can not be overwrited.
-    In this project it is used to be sure that system do not ask about the same
-    problem twice
+    A single found problem. Supports the dict-like access used by the rest
+    of the code (problem['pos']). The key 'choice' can be set only once,
+    so the system does not ask about the same problem twice.
+    'options' and 'text_to_show' are not stored: they are built on access
+    by the checker, which found the problem (text_to_show is kept after
+    the first access)
     '''
-    def __init__(self, data, protected_key='choice'):
-        super().__init__(data)
-        self.__protected_key = protected_key
-        self.__protecked_key_is_used = True if protected_key in self else False
+    
+    __slots__ = ('pos', 'len', 's', 'type', 'word', 'choice',
+                 '_checker', '_text', '_sentences', '_options', '_text_to_show')
+    KEYS = ('pos', 'len', 's', 'type', 'word', 'choice', 'options', 'text_to_show')
+    STORED_KEYS = ('pos', 'len', 's', 'type', 'word', 'choice')
+    
+    def __init__(self, pos, length, replacements, problem_type, word=None):
+        self.pos = pos
+        self.len = length
+        self.s = replacements
+        self.type = problem_type
+        self.word = word
+        self.choice = None
+        self._checker = None
+        self._text = None
+        self._sentences = None
+        self._options = None
+        self._text_to_show = None
         
-    def __setitem__(self, key, value):
-        if key != self.__protected_key:
-            super().__setitem__(key, value)
-        else:
-            if not self.__protecked_key_is_used:
-                self.__protecked_key_is_used = True
-                super().__setitem__(key, value)
-            else:
-                raise(ProtectedKeyException)
+    @classmethod
+    def from_dict(cls, data, problem_type=None):
+        '''
+        Makes a problem from a speller answer or a saved problem,
+        unknown keys are ignored
+        '''
+        problem = cls(data['pos'], data['len'], list(data['s']),
+                      data.get('type', problem_type), data.get('word'))
+        for key in ('choice', 'options', 'text_to_show'):
+            if key in data:
+                problem[key] = copy(data[key])
+        return problem
     
-    def get_protected_key(self):
-        return copy(self.__protected_key)
-                                        
-
-class SpellChecker(AbstractAspectChecker):  
-    '''
-    In  this project YandexSpeller is used.
-    Output of other checkers has the same type
-    '''
-
-    def _check_texts(self, texts, CHECKER_LIMIT=10000):
+    def __copy__(self):
         '''
-        Makes a query to YandexSpeller, if the texts do not exceed its limit.
-        It they do, join the output of several queries
+        A separate problem with the same data (the choice is not copied)
         '''
-        if sum([len(text) for text in texts]) < CHECKER_LIMIT:
-            problems = self.__checker_query(texts)
-        else:
-            problems = self.__split_and_check(texts)
-        for text_problems in problems:
-            for problem in text_problems:
-                problem['type'] = 'spelling'
-        return problems
+        problem = Problem(self.pos, self.len, list(self.s), self.type, self.word)
+        problem._checker = self._checker
+        problem._text = self._text
+        problem._sentences = self._sentences
+        problem._options = copy(self._options)
+        problem._text_to_show = self._text_to_show
+        return problem
     
-    def __checker_query(self, texts):
-        response = requests.post('https://speller.yandex.net/services/spellservice.json/checkTexts',
-                                 {'text': texts}).json()
-        problems = [[DictWithProtectedKey(problem) for problem in text_problems] 
-        for text_problems in response]
-        return problems
+    def review(self, choice):
+        '''
+        Sets the choice made by the user. Unlike problem['choice'] = choice
+        it replaces the choice restored from the previous run, which is
+        only preselected in the review
+        '''
+        self.choice = choice
+        
+    def attach(self, checker, text, sentences=None):
+        '''
+        Remembers the checker and the text for building options and context,
+        sentences - the dict for the split texts shared by the problems
+        of one check
+        '''
+        self._checker = checker
+        self._text = text
+        self._sentences = sentences
+        
+    def to_dict(self):
+        '''
+        The stored data of the problem to save (without options and text_to_show,
+        which are built from the text)
+        '''
+        return {key: copy(getattr(self, key)) for key in self.STORED_KEYS
+                if getattr(self, key) is not None}
+        
+    def __getitem__(self, key):
+        if key == 'options':
+            value = self._options
+            if value is None and self._checker is not None:
+                value = self._checker._get_options(self)
+        elif key == 'text_to_show':
+            value = self._text_to_show
+            if value is None and self._checker is not None:
+                value = self._checker._get_text_to_show(self._text, self)
+                self._text_to_show = value
+        elif key in self.KEYS:
+            value = getattr(self, key)
+        else:
+            value = None
+        if value is None:
+            raise KeyError(key)
+        return value
     
-    def __split_and_check(self, texts, CHECKER_LIMIT):
-        if all([len(text) for text in texts]) < CHECKER_LIMIT:
-            responses = []
-            current_texts = []
-            current_len = 0
-            for i, text in enumerate(texts):
-                if current_len + len(text) > CHECKER_LIMIT:
-                    responses += self.__checker_query(current_texts)
-                    current_len = 0
-                    current_texts = []
-                current_texts.append(text)
-            responses += self.__checker_query(current_texts)
-            return responses
+    def __setitem__(self, key, value):
+        if key == 'choice':
+            if self.choice is not None:
+                raise ProtectedKeyException(key)
+            self.choice = value
+        elif key == 'options':
+            self._options = value
+        elif key == 'text_to_show':
+            self._text_to_show = value
+        elif key in self.KEYS:
+            setattr(self, key, value)
         else:
-            raise Exception('В тексте не должно быть блоков длиннее '+
-                            str(CHECKER_LIMIT) + ' символов')
-            
-    def _get_text_to_show(self, text, problem):
-        text_fragment = super()._get_text_to_show(text, problem)
-        word_note = 'Опечатка в слове ' + problem['word'] + ': '
-        return word_note + text_fragment      
+            raise KeyError(key)
+        
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+    
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+    
+    def keys(self):
+        return [key for key in self.KEYS if key in self]
+    
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+    
+    def __repr__(self):
+        return 'Problem({})'.format(dict(self))
 
-class TypographyChecker(AbstractAspectChecker):
+
+class SpellerException(Exception):
+    def __init__(self, text):
+        super().__init__(text)
+        self.text = text
+
+
+class SpellerClient:
     '''
-    Checks type of dash and quotation.
-    Do not check punctuation (only typography)
+    Sends batches of texts to YandexSpeller (method checkTexts).
+    Keeps the connections alive, runs up to max_in_flight requests at once
+    (in all the threads using the client) and retries the requests failed with 429 or 5xx with exponential
+    backoff and jitter.
     '''
-       
-    def __init__(self):
-        self.__problem_comments = {'hypher_between_spaces':
-            'Дефис между пробелами. Рекомендуем заменить дефис на тире либо убрать пробелы.',
-                                   'dash_between_digits':
-                                       'Между цифрами ставится среднее тире (значение от ... до ...) либо дефис (приблизительное значение)',
-                                   'quotation_type': 'Неверный тип кавычек.'}
     
+    DEFAULT_URL = 'https://speller.yandex.net/services/spellservice.json/checkTexts'
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
     
-    def _check_texts(self, texts):
-        return [(self.__check_dash(text) + self.__check_quotation(text))
-                for text in texts]
-    
-
-    def __check_dash(self, text):
-        dash_problems = []
-        
-        hypher_between_spaces = self.__find_all_matches(' - ', text)
-        for problem in hypher_between_spaces:
-            problem['s'] = [' — ', '-']
-            problem['type'] = 'hypher_between_spaces'
-        dash_problems += hypher_between_spaces
-        
-        dash_between_digits = self.__find_all_matches('\d[-—]\d', text)
-        for problem in dash_between_digits:
-            problem['s']  = ['–', '-']
-            problem['len'] = 1
-            problem['pos'] += 1
-            problem['type'] = 'dash_between_digits'
-        dash_problems += dash_between_digits
-        
-        return dash_problems
-    
-    def __check_quotation(self, text): 
-        quotation_problems = []
-        general_state = 0
-        inner_state = 0
-        wrong_inner_state = 0
-        for i, symbol in enumerate(text):
-            if symbol in '„“"':
-                if general_state==0:
-                    problem = DictWithProtectedKey({'pos': i, 'type': 'quotation_type', 'len': 1})
-                    if wrong_inner_state==0:
-                        problem['s'] = ['«', '']
-                        wrong_inner_state = 1
-                    else:
-                        problem['s'] = ['»', '']
-                        wrong_inner_state = 0
-                    quotation_problems.append(problem)
+    def __init__(self, url=DEFAULT_URL, max_in_flight=4, timeout=10,
+                 max_retries=4, backoff_base=0.5, backoff_max=8.0,
+                 lang='ru,en', options=0):
+        self.url = url
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lang = lang
+        self.options = options
+        self.in_flight = 0 ##Requests sent and not answered yet
+        self.__session = None
+        self.__session_lock = threading.Lock()
+        self.__in_flight_lock = threading.Lock()
+        self.__request_slots = threading.BoundedSemaphore(self.max_in_flight)
+        
+    def check_batches(self, batches):
+        '''
+        Input: a list of batches (lists of texts).
+        Output: a list of raw problem lists, one for each text,
+        in the same order as the texts in the batches
+        '''
+        if len(batches) > 1 and self.max_in_flight > 1:
+            workers = min(self.max_in_flight, len(batches))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                responses = list(executor.map(self.query, batches))
+        else:
+            responses = [self.query(batch) for batch in batches]
+        return [text_problems for response in responses
+                for text_problems in response]
+    
+    def query(self, texts):
+        '''
+        Checks one batch of texts, retrying on throttling and server errors
+        '''
+        data = {'text': texts, 'lang': self.lang, 'options': self.options}
+        for attempt in range(self.max_retries + 1):
+            if METRICS.enabled:
+                METRICS.add('speller_requests')
+                METRICS.add('speller_bytes_sent', sum(len(text.encode('utf-8'))
+                                                      for text in texts))
+                if attempt:
+                    METRICS.add('speller_retries')
+            with self.__request_slots:
+                self.__count_in_flight(1)
+                try:
+                    response = self._session().post(self.url, data=data,
+                                                    timeout=self.timeout)
+                except (requests.ConnectionError, requests.Timeout) as error:
+                    failure = str(error)
                 else:
-                    if inner_state==0:
-                        inner_state=1
-                        if symbol == '“':
-                            problem = DictWithProtectedKey({'pos': i, 'type': 'quotation_type',
-                                       'len': 1, 's': ['„', '']})
-                            quotation_problems.append(problem)
-                    else:
-                        inner_state=0
-                        if symbol == '„':
-                            problem = DictWithProtectedKey({'pos': i, 'type': 'quotation_type',
-                                       'len': 1, 's': ['“', '']})
-                            quotation_problems.append(problem)
-            elif symbol == '«':
-                if general_state == 1:
-                    problem = DictWithProtectedKey({'pos': i, 'type': 'quotation_type', 'len': 1,
-                               's': ['„', '»', '']})
-                    quotation_problems.append(problem)
-                general_state = 1
-            elif symbol == '»':
-                if general_state == 0:
-                    problem = DictWithProtectedKey({'pos': i, 'type': 'quotation_type', 'len': 1,
-                               's': ['«', '']})
-                    quotation_problems.append(problem)
-                general_state = 0
-        return quotation_problems
+                    if response.status_code not in self.RETRY_STATUSES:
+                        response.raise_for_status()
+                        METRICS.add('speller_bytes_received', len(response.content))
+                        return response.json()
+                    failure = 'HTTP ' + str(response.status_code)
+                finally:
+                    self.__count_in_flight(-1)
+            if attempt < self.max_retries:
+                time.sleep(self._backoff_delay(attempt))
+        raise SpellerException('Сервис проверки орфографии недоступен ('
+                               + failure + ')')
     
-        
+    def __count_in_flight(self, change):
+        with self.__in_flight_lock:
+            self.in_flight += change
+    
+    def _backoff_delay(self, attempt):
+        '''
+        Exponential backoff with full jitter
+        '''
+        return random.uniform(0, min(self.backoff_max,
+                                     self.backoff_base * 2 ** attempt))
+    
+    def _session(self):
+        with self.__session_lock:
+            if self.__session is None:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.max_in_flight)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self.__session = session
+            return self.__session
+    
+    def cache_namespace(self):
+        '''
+        Identifies the service and the language options in SpellCache keys
+        '''
+        return '{}|{}|{}'.format(self.url, self.lang, self.options)
+    
+    def close(self):
+        with self.__session_lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+
+class LocalSpeller:
+    '''
+    Offline replacement for SpellerClient with the same interface.
+    Looks the words up in an index of a frequency dictionary (build_index)
+    and suggests the dictionary words within max_distance edits. As in
+    SymSpell, the index also stores the words with deleted letters, so the
+    candidates are found by lookups instead of generating all the edits.
+    The index is memory-mapped: loading does not depend on its size.
+    The words are indexed and looked up with 'ё' replaced by 'е',
+    so both spellings are accepted, the suggestions keep the dictionary one.
+    The answers have the same structure as the answers of YandexSpeller.
+    '''
+    
+    MAGIC = b'PCSPELL2'
+    HEADER = struct.Struct('<8sIIII') ##magic, max_distance, words, deletes, blob size
+    WORD_PATTERN = re.compile(r'[^\W\d_]+')
+    
+    def __init__(self, index_path, max_suggestions=5, cache_size=100000):
+        self.index_path = index_path
+        self.max_suggestions = max_suggestions
+        self.__file = open(index_path, 'rb')
+        self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_distance, words_count, deletes_count, blob_size = \
+            self.HEADER.unpack_from(self.__mmap)
+        if magic != self.MAGIC:
+            raise SpellerException('Неверный формат словаря ' + index_path)
+        self.__views = []
+        offset = self.HEADER.size
+        self.__word_hashes, offset = self.__array(offset, 'Q', words_count)
+        self.__delete_hashes, offset = self.__array(offset, 'Q', deletes_count)
+        self.__word_ids, offset = self.__array(offset, 'I', words_count)
+        self.__delete_ids, offset = self.__array(offset, 'I', deletes_count)
+        self.__frequencies, offset = self.__array(offset, 'I', words_count)
+        self.__offsets, offset = self.__array(offset, 'I', words_count + 1)
+        self.__blob, offset = self.__array(offset, 'B', blob_size)
+        self.__check_word = functools.lru_cache(maxsize=cache_size)(self.__check_word_uncached)
+        
+    def __array(self, offset, typecode, count):
+        size = array.array(typecode).itemsize * count
+        view = memoryview(self.__mmap)[offset:offset + size]
+        if typecode != 'B':
+            view = view.cast(typecode)
+        self.__views.append(view)
+        return view, offset + size
+    
+    @staticmethod
+    def _hash(word):
+        return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(),
+                              'little')
+    
+    @staticmethod
+    def _key(word):
+        return word.replace('ё', 'е')
+    
+    @staticmethod
+    def _deletes(word, max_distance):
+        '''
+        All the strings made by deleting up to max_distance letters
+        '''
+        deletes = set()
+        current = {word}
+        for distance in range(max_distance):
+            current = {variant[:i] + variant[i+1:] for variant in current
+                       for i in range(len(variant))}
+            deletes |= current
+        deletes.discard(word)
+        return deletes
+    
+    @staticmethod
+    def _edit_distance(word1, word2):
+        '''
+        Levenshtein distance, transposition of two neighbouring letters
+        counts as one edit
+        '''
+        previous2 = None
+        previous = list(range(len(word2) + 1))
+        for i in range(1, len(word1) + 1):
+            current = [i] + [0] * len(word2)
+            for j in range(1, len(word2) + 1):
+                cost = 0 if word1[i-1] == word2[j-1] else 1
+                current[j] = min(previous[j] + 1, current[j-1] + 1, previous[j-1] + cost)
+                if (previous2 is not None and i > 1 and j > 1 and
+                        word1[i-1] == word2[j-2] and word1[i-2] == word2[j-1]):
+                    current[j] = min(current[j], previous2[j-2] + 1)
+            previous2, previous = previous, current
+        return previous[-1]
+    
+    def __find(self, hashes, ids, word_hash):
+        i = bisect.bisect_left(hashes, word_hash)
+        while i < len(hashes) and hashes[i] == word_hash:
+            yield ids[i]
+            i += 1
+            
+    def _word(self, word_id):
+        return str(self.__blob[self.__offsets[word_id]:self.__offsets[word_id+1]], 'utf-8')
+    
+    def is_known(self, word):
+        key = self._key(word)
+        return any(self._key(self._word(word_id)) == key for word_id in
+                   self.__find(self.__word_hashes, self.__word_ids, self._hash(key)))
+    
+    def suggest(self, word):
+        '''
+        Returns the dictionary words within max_distance edits,
+        the closest and the most frequent first
+        '''
+        key = self._key(word)
+        candidates = set()
+        for variant in self._deletes(key, self.max_distance) | {key}:
+            variant_hash = self._hash(variant)
+            candidates.update(self.__find(self.__word_hashes, self.__word_ids, variant_hash))
+            candidates.update(self.__find(self.__delete_hashes, self.__delete_ids, variant_hash))
+        suggestions = []
+        for word_id in candidates:
+            candidate = self._word(word_id)
+            distance = self._edit_distance(key, self._key(candidate))
+            if 0 < distance <= self.max_distance:
+                suggestions.append((distance, -self.__frequencies[word_id], candidate))
+        return [candidate for distance, frequency, candidate
+                in sorted(suggestions)[:self.max_suggestions]]
+    
+    def __check_word_uncached(self, word):
+        '''
+        Returns None for a known word and the list of suggestions otherwise.
+        Abbreviations (all capital letters) are not checked
+        '''
+        if len(word) < 2 or word.isupper():
+            return None
+        lower_word = word.lower()
+        if self.is_known(lower_word):
+            return None
+        suggestions = self.suggest(lower_word)
+        if word[0].isupper():
+            suggestions = [suggestion.capitalize() for suggestion in suggestions]
+        return suggestions
+    
+    def check_text(self, text):
+        problems = []
+        for match in self.WORD_PATTERN.finditer(text):
+            suggestions = self.__check_word(match.group())
+            if suggestions is not None:
+                problems.append({'code': 1, 'pos': match.start(),
+                                 'len': match.end() - match.start(),
+                                 'word': match.group(), 's': suggestions})
+        return problems
+    
+    def query(self, texts):
+        return [self.check_text(text) for text in texts]
+    
+    def check_batches(self, batches):
+        return [self.check_text(text) for batch in batches for text in batch]
+    
+    def cache_namespace(self):
+        return 'local|{}|{}'.format(os.path.abspath(self.index_path),
+                                    os.path.getmtime(self.index_path))
+    
+    def close(self):
+        for view in self.__views:
+            view.release()
+        self.__views = []
+        self.__mmap.close()
+        self.__file.close()
+        
+    @classmethod
+    def build_index(cls, dictionary_paths, index_path, max_distance=1):
+        '''
+        Builds the index from frequency dictionaries: text files with
+        a word and optionally its frequency on each line
+        '''
+        frequencies = {}
+        for path in dictionary_paths:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if not parts:
+                        continue
+                    word = parts[0].lower()
+                    frequency = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 1
+                    frequencies[word] = max(frequencies.get(word, 0), frequency)
+        words = sorted(frequencies)
+        word_records = sorted((cls._hash(cls._key(word)), i) for i, word in enumerate(words))
+        delete_records = sorted({(cls._hash(delete), i) for i, word in enumerate(words)
+                                 for delete in cls._deletes(cls._key(word), max_distance)})
+        encoded_words = [word.encode('utf-8') for word in words]
+        offsets = [0]
+        for encoded_word in encoded_words:
+            offsets.append(offsets[-1] + len(encoded_word))
+        blob = b''.join(encoded_words)
+        with open(index_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, max_distance, len(words),
+                                    len(delete_records), len(blob)))
+            f.write(array.array('Q', [record[0] for record in word_records]).tobytes())
+            f.write(array.array('Q', [record[0] for record in delete_records]).tobytes())
+            f.write(array.array('I', [record[1] for record in word_records]).tobytes())
+            f.write(array.array('I', [record[1] for record in delete_records]).tobytes())
+            f.write(array.array('I', [min(frequencies[word], 2**32 - 1)
+                                      for word in words]).tobytes())
+            f.write(array.array('I', offsets).tobytes())
+            f.write(blob)
+
+
+class SpellPrefilter:
+    '''
+    Prepares the texts for the speller. URLs, e-mails, numbers and codes
+    (words with digits) are cut out of the text, a space is left instead
+    of each of them, so the words around are not joined. The positions of
+    the problems in the answers are moved back to the original text.
+    The words of the user dictionary (a set of lowercase words) are dropped
+    from the answers
+    '''
+    
+    ## The e-mails and the codes start only at the beginning of a token and
+    ## the quantifiers are possessive, so a long token is scanned once
+    ## instead of once from each of its characters
+    SKIP_PATTERNS = (r'(?:https?://|www\.)[^\s<>"«»]++',
+                     r'(?<![\w.+-])[\w.+-]++@[\w-]++(?:\.[\w-]++)+',
+                     r'(?<![\w-])[\w-]*\d[\w-]*+')
+    
+    def __init__(self, user_words=(), skip_patterns=None):
+        self.user_words = {word.lower() for word in user_words}
+        skip_patterns = self.SKIP_PATTERNS if skip_patterns is None else skip_patterns
+        self.__skip = re.compile('|'.join(skip_patterns)) if skip_patterns else None
+        
+    def config_key(self):
+        '''
+        Identifies the skipped patterns and the user dictionary
+        '''
+        data = json.dumps([self.__skip.pattern if self.__skip is not None else None,
+                           sorted(self.user_words)], ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        '''
+        Reads the user dictionary: a word on each line
+        '''
+        with open(path, encoding='utf-8') as f:
+            return cls([line.strip() for line in f if line.strip()], **kwargs)
+        
+    def mask(self, text):
+        '''
+        Returns the text to send and the shifts: the list of the positions
+        of the cuts in the text to send and the list of the numbers of
+        the characters cut before them
+        '''
+        if self.__skip is None:
+            return text, ([], [])
+        parts = []
+        cut_positions = []
+        cut_lengths = []
+        cut = 0
+        last_end = 0
+        for match in self.__skip.finditer(text):
+            parts.append(text[last_end:match.start()])
+            parts.append(' ')
+            ## The characters after the space are shifted by all the cuts before
+            cut_positions.append(match.start() - cut + 1)
+            cut += match.end() - match.start() - 1
+            cut_lengths.append(cut)
+            last_end = match.end()
+        if not parts:
+            return text, ([], [])
+        parts.append(text[last_end:])
+        METRICS.add('spell_prefilter_chars', cut)
+        return ''.join(parts), (cut_positions, cut_lengths)
+    
+    def restore(self, problems, shifts):
+        '''
+        Moves the problems found in the masked text back to the original text
+        and drops the words of the user dictionary
+        '''
+        cut_positions, cut_lengths = shifts
+        restored = []
+        for problem in problems:
+            if problem.get('word', '').lower() in self.user_words:
+                continue
+            cut_id = bisect.bisect_right(cut_positions, problem['pos']) - 1
+            if cut_id >= 0:
+                problem = dict(problem, pos=problem['pos'] + cut_lengths[cut_id])
+            restored.append(problem)
+        return restored
+
+
+class SpellCache:
+    '''
+    On-disk (SQLite) cache of raw speller answers.
+    The key is a hash of the text and the client options. Texts are
+    taken as is: the problem positions are offsets in the exact text.
+    Entries older than max_age seconds are dropped, if there are more than
+    max_entries, the least recently used ones are dropped.
+    '''
+    
+    def __init__(self, path, max_entries=200000, max_age=30*24*3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, timeout=30,
+                                            check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('''CREATE TABLE IF NOT EXISTS spell_cache
+                                  (key TEXT PRIMARY KEY, problems TEXT,
+                                   created REAL, used REAL)''')
+        self.__connection.execute('''CREATE INDEX IF NOT EXISTS
+                                  spell_cache_used ON spell_cache (used)''')
+        self.evict()
+        
+    def key(self, text, namespace):
+        data = (namespace + '\x00' + text).encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+    
+    def get_many(self, keys):
+        '''
+        Returns a dict {key: raw problems} for the cached keys
+        '''
+        found = {}
+        keys = list(set(keys))
+        with self.__lock, self.__connection:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self.__connection.execute(
+                    'SELECT key, problems FROM spell_cache WHERE key IN ({})'
+                    .format(','.join('?'*len(chunk))), chunk)
+                found.update((key, json.loads(problems))
+                             for key, problems in rows)
+            self.__connection.executemany(
+                'UPDATE spell_cache SET used = ? WHERE key = ?',
+                [(time.time(), key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        METRICS.add('spell_cache_hits', len(found))
+        METRICS.add('spell_cache_misses', len(keys) - len(found))
+        return found
+    
+    def put_many(self, items):
+        '''
+        Input: a dict {key: raw problems}
+        '''
+        now = time.time()
+        with self.__lock, self.__connection:
+            self.__connection.executemany(
+                'INSERT OR REPLACE INTO spell_cache VALUES (?, ?, ?, ?)',
+                [(key, json.dumps(problems, ensure_ascii=False), now, now)
+                 for key, problems in items.items()])
+        if items:
+            self.evict()
+            
+    def evict(self):
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM spell_cache WHERE created < ?',
+                                      (time.time() - self.max_age,))
+            self.__connection.execute('''DELETE FROM spell_cache WHERE key IN
+                                      (SELECT key FROM spell_cache
+                                       ORDER BY used DESC LIMIT -1 OFFSET ?)''',
+                                      (self.max_entries,))
+    
+    def stats(self):
+        with self.__lock:
+            entries = self.__connection.execute(
+                'SELECT COUNT(*) FROM spell_cache').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries}
+    
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+
+class SpellChecker(AbstractAspectChecker):  
+    '''
+    In  this project YandexSpeller is used.
+    Output of other checkers has the same type.
+    The texts are passed through prefilter (SpellPrefilter) before sending,
+    the texts which are empty after it are not sent
+    '''
+    
+    def __init__(self, client=None, cache=None, prefilter=None):
+        self.client = client if client is not None else SpellerClient()
+        self.cache = cache
+        self.prefilter = prefilter if prefilter is not None else SpellPrefilter()
+        
+    def config_key(self):
+        '''
+        Identifies the options, on which the found problems depend
+        '''
+        return '{}|{}'.format(self.client.cache_namespace(), self.prefilter.config_key())
+
+    def _check_texts(self, texts, CHECKER_LIMIT=10000):
+        '''
+        Makes queries to YandexSpeller. The texts are split into batches
+        which do not exceed its limit, the batches are checked concurrently
+        '''
+        return self.__checker_query(texts, CHECKER_LIMIT)
+    
+    def __checker_query(self, texts, CHECKER_LIMIT):
+        masked = [self.prefilter.mask(text) for text in texts]
+        texts_to_send = [masked_text for masked_text, shifts in masked]
+        if self.cache is None:
+            response = self.__uncached_query(texts_to_send, CHECKER_LIMIT)
+        else:
+            response = self.__cached_query(texts_to_send, CHECKER_LIMIT)
+        response = [self.prefilter.restore(text_problems, shifts)
+                    for text_problems, (masked_text, shifts) in zip(response, masked)]
+        problems = [[Problem.from_dict(problem, 'spelling') for problem in text_problems] 
+        for text_problems in response]
+        return problems
+    
+    def __uncached_query(self, texts, CHECKER_LIMIT):
+        to_send = [i for i, text in enumerate(texts) if text.strip()]
+        response = [[] for text in texts]
+        answers = self.client.check_batches(self.__split_texts([texts[i] for i in to_send],
+                                                               CHECKER_LIMIT))
+        for i, text_problems in zip(to_send, answers):
+            response[i] = text_problems
+        return response
+    
+    def __cached_query(self, texts, CHECKER_LIMIT):
+        '''
+        Takes the answers from the cache, only the missing texts
+        are sent to the speller
+        '''
+        namespace = self.client.cache_namespace()
+        keys = [self.cache.key(text, namespace) for text in texts]
+        ## The blank texts are not sent, so they are neither hits nor misses
+        known = self.cache.get_many([key for key, text in zip(keys, texts) if text.strip()])
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in known and text.strip():
+                missing.setdefault(key, text)
+        if missing:
+            response = self.client.check_batches(
+                self.__split_texts(list(missing.values()), CHECKER_LIMIT))
+            checked = dict(zip(missing.keys(), response))
+            self.cache.put_many(checked)
+            known.update(checked)
+        return [copy(known.get(key, [])) for key in keys]
+    
+    def __split_texts(self, texts, CHECKER_LIMIT):
+        '''
+        Groups the texts into batches, each one shorter than CHECKER_LIMIT
+        '''
+        if any(len(text) >= CHECKER_LIMIT for text in texts):
+            raise Exception('В тексте не должно быть блоков длиннее '+
+                            str(CHECKER_LIMIT) + ' символов')
+        batches = []
+        current_texts = []
+        current_len = 0
+        for text in texts:
+            if current_texts and current_len + len(text) >= CHECKER_LIMIT:
+                batches.append(current_texts)
+                current_len = 0
+                current_texts = []
+            current_texts.append(text)
+            current_len += len(text)
+        if current_texts:
+            batches.append(current_texts)
+        return batches
+            
+    def _get_text_to_show(self, text, problem):
+        text_fragment = super()._get_text_to_show(text, problem)
+        word_note = 'Опечатка в слове ' + problem['word'] + ': '
+        return word_note + text_fragment      
+
+TYPOGRAPHY_RULES = []
+
+
+def register_typography_rule(rule_class):
+    '''
+    Class decorator, which adds a rule to the rules used by TypographyChecker
+    by default
+    '''
+    TYPOGRAPHY_RULES.append(rule_class())
+    return rule_class
+
+
+class TypographyRule(ABC):
+    '''
+    A single typography rule. All the rules are compiled by TypographyChecker
+    into one regular expression, so the text is scanned once.
+    Patterns of different rules should not match the same fragments.
+    The texts may be scanned joined by TypographyChecker.SEPARATOR, so the
+    patterns should not depend on whether the character next to the text
+    is SEPARATOR or there is nothing (no anchors like ^ and $)
+    '''
+    name = ''
+    pattern = ''
+    comment = ''
+    
+    def new_state(self):
+        '''
+        Returns the state of the rule at the beginning of a text
+        (for the rules which depend on the previous matches)
+        '''
+        return None
+    
+    @abstractmethod
+    def make_problems(self, match, state):
+        '''
+        Converts a match into a list of problems
+        '''
+        pass
+    
+    def _problem(self, pos, length, replacements):
+        return Problem(pos, length, replacements, self.name)
+
+
+@register_typography_rule
+class HyphenBetweenSpacesRule(TypographyRule):
+    name = 'hypher_between_spaces'
+    pattern = ' - '
+    comment = 'Дефис между пробелами. Рекомендуем заменить дефис на тире либо убрать пробелы.'
+    
+    def make_problems(self, match, state):
+        return [self._problem(match.start(), 3, [' — ', '-'])]
+
+
+@register_typography_rule
+class DashBetweenDigitsRule(TypographyRule):
+    name = 'dash_between_digits'
+    pattern = r'(?<=\d)[-—](?=\d)'
+    comment = 'Между цифрами ставится среднее тире (значение от ... до ...) либо дефис (приблизительное значение)'
+    
+    def make_problems(self, match, state):
+        return [self._problem(match.start(), 1, ['–', '-'])]
+
+
+@register_typography_rule
+class QuotationRule(TypographyRule):
+    '''
+    Outer quotes should be «», inner quotes should be „“.
+    '''
+    name = 'quotation_type'
+    pattern = '[„“"«»]'
+    comment = 'Неверный тип кавычек.'
+    
+    def new_state(self):
+        return {'general': 0, 'inner': 0, 'wrong_inner': 0}
+    
+    def make_problems(self, match, state):
+        symbol = match.group()
+        i = match.start()
+        if symbol == '«':
+            state['general'], was_open = 1, state['general']
+            return [self._problem(i, 1, ['„', '»', ''])] if was_open else []
+        if symbol == '»':
+            state['general'], was_open = 0, state['general']
+            return [] if was_open else [self._problem(i, 1, ['«', ''])]
+        if state['general'] == 0:
+            if state['wrong_inner'] == 0:
+                state['wrong_inner'] = 1
+                return [self._problem(i, 1, ['«', ''])]
+            state['wrong_inner'] = 0
+            return [self._problem(i, 1, ['»', ''])]
+        if state['inner'] == 0:
+            state['inner'] = 1
+            return [self._problem(i, 1, ['„', ''])] if symbol == '“' else []
+        state['inner'] = 0
+        return [self._problem(i, 1, ['“', ''])] if symbol == '„' else []
+
+
+class TypographyChecker(AbstractAspectChecker):
+    '''
+    Checks type of dash and quotation.
+    Do not check punctuation (only typography).
+    If batched, the texts are joined and scanned at once: with thousands
+    of short texts the cost of a scan per text is larger than the scan itself
+    '''
+    
+    SEPARATOR = '\x00' ##Can not be in the XML text of a presentation
+       
+    def __init__(self, rules=None, batched=True):
+        self.rules = list(TYPOGRAPHY_RULES if rules is None else rules)
+        self.batched = batched
+        self.__problem_comments = {rule.name: rule.comment for rule in self.rules}
+        self.__scanner = re.compile('|'.join(
+            '(?P<rule{}>{})'.format(i, rule.pattern)
+            for i, rule in enumerate(self.rules)))
+        self.__rule_ids = {'rule{}'.format(i): i for i in range(len(self.rules))}
+        
+    def config_key(self):
+        return '|'.join(rule.name for rule in self.rules)
+    
+    def _check_texts(self, texts):
+        if self.batched and len(texts) > 1:
+            problems = self.__check_joined_texts(texts)
+            if problems is not None:
+                return problems
+        return [self.__check_text(text) for text in texts]
+    
+    def __check_joined_texts(self, texts):
+        '''
+        Scans the texts joined by SEPARATOR. The match is mapped to its text
+        by binary search over the offsets of the texts, the states of
+        the rules are reset at the beginning of each text.
+        Returns None if the texts can not be joined
+        '''
+        if any(self.SEPARATOR in text for text in texts):
+            return None
+        starts = list(itertools.accumulate((len(text) + 1 for text in texts[:-1]),
+                                           initial=0))
+        problems = [[] for text in texts]
+        text_id = -1
+        text_end = -1
+        ## The state of a rule is created at its first match in a text
+        states = [None] * len(self.rules)
+        states_text = [-1] * len(self.rules)
+        for match in self.__scanner.finditer(self.SEPARATOR.join(texts)):
+            if match.start() >= text_end:
+                text_id = bisect.bisect_right(starts, match.start(), text_id + 1) - 1
+                text_start = starts[text_id]
+                text_end = text_start + len(texts[text_id])
+                text_problems = problems[text_id]
+            if match.end() > text_end: ##The match includes the separator
+                return None
+            rule_id = self.__rule_ids[match.lastgroup]
+            if states_text[rule_id] != text_id:
+                states[rule_id] = self.rules[rule_id].new_state()
+                states_text[rule_id] = text_id
+            for problem in self.rules[rule_id].make_problems(match, states[rule_id]):
+                problem.pos -= text_start
+                text_problems.append(problem)
+        return problems
+    
+    def __check_text(self, text):
+        '''
+        Scans the text once, each match is passed to its rule
+        '''
+        problems = []
+        states = [rule.new_state() for rule in self.rules]
+        for match in self.__scanner.finditer(text):
+            rule_id = self.__rule_ids[match.lastgroup]
+            problems += self.rules[rule_id].make_problems(match, states[rule_id])
+        return problems
+        
     def _get_text_to_show(self, text, problem):
         text_to_show = super()._get_text_to_show(text, problem)
         text_to_show = self.__problem_comments[problem['type']] +'\n' + text_to_show
@@ -625,45 +2198,387 @@ class TypographyChecker(AbstractAspectChecker):
         else:
             options = super()._get_options(problem)
         return options
+    
+
+class CheckManifest:
+    '''
+    JSON file stored next to the checked file. For each shape it keeps
+    the hash of the text, the chosen aspects, the fingerprint of the checkers
+    (config_key, see AspectCheckerManager.config_key), the found problems
+    and the user choices. Texts with a known hash are not checked again
+    by the checkers with the same fingerprint.
+    Only the shapes of the last run are saved.
+    '''
+    
+    SUFFIX = '.check.json'
+    
+    def __init__(self, path, config_key=''):
+        self.path = path
+        self.config_key = config_key
+        self.__known = {}
+        self.__current = {}
+        self.__shapes = []
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for shape in json.load(f).get('shapes', []):
+                    self.__known[(shape['hash'], tuple(shape['aspects']),
+                                  shape.get('config'))] = shape['problems']
+    
+    @classmethod
+    def for_file(cls, file_path, config_key=''):
+        return cls(file_path + cls.SUFFIX, config_key)
+    
+    def text_hash(self, text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+    
+    def __key(self, text, chosen_aspects):
+        return (self.text_hash(text), tuple(sorted(chosen_aspects)), self.config_key)
+    
+    def lookup(self, text, chosen_aspects):
+        '''
+        Returns the problems found in the same text during the previous run
+        or None
+        '''
+        key = self.__key(text, chosen_aspects)
+        problems = self.__current.get(key, self.__known.get(key))
+        if problems is None:
+            return None
+        return [Problem.from_dict(problem.to_dict() if isinstance(problem, Problem) else problem)
+                for problem in problems]
+    
+    def lookup_many(self, texts, chosen_aspects):
+        '''
+        Returns the results of lookup for each of the texts
+        '''
+        return [self.lookup(text, chosen_aspects) for text in texts]
+    
+    def record(self, text, chosen_aspects, problems):
+        '''
+        Stores the problems of a text. The problem dicts are kept by reference,
+        so the choices added later are saved too
+        '''
+        key = self.__key(text, chosen_aspects)
+        self.__current[key] = problems
+        self.__shapes.append({'shape': len(self.__shapes),
+                              'hash': key[0], 'aspects': list(key[1]), 'config': key[2],
+                              'problems': problems})
+    
+    def save(self):
+        shapes = [dict(shape, problems=[problem.to_dict() for problem in shape['problems']])
+                  for shape in self.__shapes]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump({'shapes': shapes}, f, ensure_ascii=False)
+
+
+class BatchJournal:
+    '''
+    SQLite journal of a batch job. It keeps the problems of each checked
+    text (by the hash of the text and of the check options) and the results
+    of the finished files (by the path, the size, the modification time
+    and the options). A restarted job takes the finished files and
+    the checked texts from it, so it continues where it stopped,
+    also in the middle of a file
+    '''
+    
+    def __init__(self, path):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('''CREATE TABLE IF NOT EXISTS texts
+                                  (key TEXT PRIMARY KEY, problems TEXT)''')
+        self.__connection.execute('''CREATE TABLE IF NOT EXISTS files
+                                  (path TEXT PRIMARY KEY, signature TEXT, status TEXT,
+                                   result TEXT, updated REAL)''')
+        self.__connection.commit()
         
+    def file_signature(self, file_path, job_key):
+        stat = os.stat(file_path)
+        data = '{}|{}|{}'.format(stat.st_size, stat.st_mtime_ns, job_key)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    def finished_result(self, file_path, signature):
+        '''
+        Returns the saved result of the file or None if the file
+        has not been finished with the same signature
+        '''
+        with self.__lock:
+            row = self.__connection.execute(
+                'SELECT signature, result FROM files WHERE path = ?',
+                (os.path.abspath(file_path),)).fetchone()
+        if row is None or row[0] != signature:
+            return None
+        return json.loads(row[1])
+    
+    def finish_file(self, file_path, signature, result):
+        status = 'corrected' if result.get('corrected_file') else 'checked'
+        with self.__lock, self.__connection:
+            self.__connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                                      (os.path.abspath(file_path), signature, status,
+                                       json.dumps(result, ensure_ascii=False), time.time()))
             
-    def __find_all_matches(self, pattern, string):
+    def texts(self, texts_key, manifest=None):
+        '''
+        Returns the object with the interface of CheckManifest (lookup, record,
+        save), which keeps the problems of the texts in the journal.
+        If manifest is given, it gets the same calls
+        '''
+        return JournalTexts(self, texts_key, manifest)
+    
+    def lookup_texts(self, keys):
+        found = {}
+        with self.__lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                rows = self.__connection.execute(
+                    'SELECT key, problems FROM texts WHERE key IN ({})'
+                    .format(','.join('?'*len(chunk))), chunk)
+                found.update((key, json.loads(problems)) for key, problems in rows)
+        return found
+    
+    def record_texts(self, items):
         '''
-        Returns dicts with positiion and length of all the matches
+        Input: a dict {key: problem dicts}
         '''
-        matches = []
-        current_match = re.search(pattern, string)
-        while current_match:
-            matches.append({'pos': current_match.start(),
-                            'len': current_match.end()-current_match.start()})
-            if current_match.end() < len(string):
-                current_match = re.search(pattern,
-                                          string[current_match.end():])
+        with self.__lock, self.__connection:
+            self.__connection.executemany('INSERT OR REPLACE INTO texts VALUES (?, ?)',
+                                          [(key, json.dumps(problems, ensure_ascii=False))
+                                           for key, problems in items.items()])
+            
+    def close(self):
+        self.__connection.close()
+        
+        
+class JournalTexts:
+    '''
+    The problems of the texts of one file in BatchJournal, see BatchJournal.texts.
+    The recorded problems are written to the journal by save
+    '''
+    
+    def __init__(self, journal, texts_key, manifest=None):
+        self.journal = journal
+        self.texts_key = texts_key
+        self.manifest = manifest
+        self.__found = {}
+        self.__recorded = {}
+        
+    def __key(self, text, chosen_aspects):
+        data = '{}|{}\x00{}'.format(self.texts_key, sorted(chosen_aspects), text)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    def lookup(self, text, chosen_aspects):
+        return self.lookup_many([text], chosen_aspects)[0]
+    
+    def lookup_many(self, texts, chosen_aspects):
+        '''
+        The texts which are not found yet are looked up in the journal
+        by one query, the others not found there - in the manifest
+        '''
+        keys = [self.__key(text, chosen_aspects) for text in texts]
+        missing = [key for key in dict.fromkeys(keys) if key not in self.__found]
+        if missing:
+            self.__found.update(self.journal.lookup_texts(missing))
+        texts_problems = []
+        for text, key in zip(texts, keys):
+            if key in self.__found:
+                texts_problems.append([Problem.from_dict(problem)
+                                       for problem in self.__found[key]])
+            elif self.manifest is not None:
+                texts_problems.append(self.manifest.lookup(text, chosen_aspects))
             else:
-                current_match = None
-        return matches
+                texts_problems.append(None)
+        return texts_problems
     
-
+    def record(self, text, chosen_aspects, problems):
+        key = self.__key(text, chosen_aspects)
+        if key not in self.__found:
+            self.__recorded[key] = [problem.to_dict() for problem in problems]
+        if self.manifest is not None:
+            self.manifest.record(text, chosen_aspects, problems)
+            
+    def save(self):
+        if self.__recorded:
+            self.journal.record_texts(self.__recorded)
+            self.__found.update(self.__recorded)
+            self.__recorded = {}
+        if self.manifest is not None:
+            self.manifest.save()
+            
+            
 class AspectCheckerManager:
     '''
     Joins output of SpellChecker() and TypographyChecker(). 
     '''
     
-    def __init__(self):
-        self.spell_checker = SpellChecker()
-        self.typography_checker = TypographyChecker()
+    STREAM_CHUNK_SIZE = 64
     
-    def set_problems(self, file_to_check, chosen_aspects):
+    def __init__(self, spell_checker=None, typography_checker=None):
+        self.spell_checker = spell_checker or SpellChecker()
+        self.typography_checker = typography_checker or TypographyChecker()
         
-        texts = file_to_check.texts_to_checker() 
-        spelling_problems = self.__check_aspect(texts, self.spell_checker,
-                                                ('Проверка орфографии' in chosen_aspects))
-        typography_problems = self.__check_aspect(texts, self.typography_checker,
-                                                  ('Проверка типографского оформления' in chosen_aspects)) 
-        texts_problems = self.__sum_problems(spelling_problems,
-                                             typography_problems)
-        file_to_check.set_texts_problems(texts_problems)
+    def config_key(self):
+        '''
+        Fingerprint of the checkers' options (the speller, its language,
+        dictionaries and prefilter, the typography rules): the problems saved
+        with another fingerprint are not reused
+        '''
+        data = '{}\x00{}'.format(self.spell_checker.config_key(),
+                                  self.typography_checker.config_key())
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()
+    
+    @TimedDecorator('set_problems')
+    def set_problems(self, file_to_check, chosen_aspects, manifest=None):
+        '''
+        If manifest (CheckManifest) is given, only the texts which are not
+        in it are checked, the results of the others are taken from it.
+        Identical texts are checked once, each copy gets its own problems
+        '''
+        job = self._prepare(file_to_check, chosen_aspects, manifest)
+        self._merge(job, self._check_aspect(job, SPELLING_ASPECT),
+                    self._check_aspect(job, TYPOGRAPHY_ASPECT))
+        
+    def _prepare(self, file_to_check, chosen_aspects, manifest=None):
+        '''
+        Returns the job (see _prepare_texts) for all the texts of the file
+        '''
+        job = self._prepare_texts(file_to_check.texts_to_checker(), chosen_aspects, manifest)
+        job['file'] = file_to_check
+        return job
+    
+    def _prepare_texts(self, texts, chosen_aspects, manifest=None, checked=None):
+        '''
+        The first step of checking the texts. The problems of the texts known
+        from the manifest or from checked (a dict text: problems of the texts
+        checked before, e.g. in the previous chunks) are taken, of the other
+        texts the identical ones are checked once.
+        Returns the job: the data passed between the steps
+        (_check_aspect, _merge_texts)
+        '''
+        texts_problems = [None] * len(texts)
+        if manifest is not None:
+            texts_problems = manifest.lookup_many(texts, chosen_aspects)
+            self.__attach_restored(texts, texts_problems)
+        if checked:
+            for i, text in enumerate(texts):
+                if texts_problems[i] is None and text in checked:
+                    texts_problems[i] = [copy(problem) for problem in checked[text]]
+        to_check = [i for i, problems in enumerate(texts_problems) if problems is None]
+        unique_texts = list(dict.fromkeys(texts[i] for i in to_check))
+        METRICS.add('duplicate_texts', len(to_check) - len(unique_texts))
+        return {'aspects': chosen_aspects, 'manifest': manifest, 'checked': checked,
+                'texts': texts, 'texts_problems': texts_problems,
+                'to_check': to_check, 'unique_texts': unique_texts}
     
+    def _check_aspect(self, job, aspect):
+        '''
+        Checks the unique texts of the job in one aspect
+        '''
+        checker = {SPELLING_ASPECT: self.spell_checker,
+                   TYPOGRAPHY_ASPECT: self.typography_checker}[aspect]
+        return self.__check_aspect(job['unique_texts'], checker,
+                                   aspect in job['aspects'] and job['unique_texts'])
+    
+    def _merge_texts(self, job, spelling_problems, typography_problems):
+        '''
+        Joins the problems of the aspects, gives them to all the copies
+        of the texts and records the problems of the texts to the manifest.
+        Returns the problems of the texts of the job
+        '''
+        texts, texts_problems = job['texts'], job['texts_problems']
+        checked = self.__spread([texts[i] for i in job['to_check']], job['unique_texts'],
+                                self.__sum_problems(spelling_problems, typography_problems))
+        for i, problems in zip(job['to_check'], checked):
+            texts_problems[i] = problems
+            if job['checked'] is not None:
+                job['checked'].setdefault(texts[i], problems)
+        if job['manifest'] is not None:
+            for text, problems in zip(texts, texts_problems):
+                job['manifest'].record(text, job['aspects'], problems)
+        return texts_problems
+    
+    def _merge(self, job, spelling_problems, typography_problems):
+        '''
+        Joins the problems of the aspects and sets them to the file
+        '''
+        job['file'].set_texts_problems(self._merge_texts(job, spelling_problems,
+                                                         typography_problems))
+        
+    def __check_job(self, job):
+        return self._merge_texts(job, self._check_aspect(job, SPELLING_ASPECT),
+                                 self._check_aspect(job, TYPOGRAPHY_ASPECT))
+        
+    @TimedDecorator('set_problems')
+    def set_problems_by_chunks(self, file_to_check, chosen_aspects, manifest=None,
+                               on_chunk=None, cancel_event=None, chunk_size=None):
+        '''
+        The same as set_problems, but the texts are checked by chunks in their
+        order and on_chunk(index of the first text, problems of the texts)
+        is called after each chunk. If cancel_event (threading.Event) is set,
+        the checking stops after the current chunk and False is returned.
+        The texts which are not checked get no problems
+        '''
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        texts = file_to_check.iter_texts_to_checker()
+        texts_problems = []
+        checked = {}
+        try:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return False
+                chunk = list(itertools.islice(texts, chunk_size))
+                if not chunk:
+                    return True
+                chunk_problems = self.__check_job(self._prepare_texts(chunk, chosen_aspects,
+                                                                      manifest, checked))
+                if on_chunk is not None:
+                    on_chunk(len(texts_problems), chunk_problems)
+                texts_problems += chunk_problems
+        finally:
+            unchecked = file_to_check.texts_to_checker()[len(texts_problems):]
+            file_to_check.set_texts_problems(texts_problems + [[] for text in unchecked])
+        
+    def iter_problems(self, texts, chosen_aspects, chunk_size=None):
+        '''
+        Checks the texts (any iterable, e.g. a generator of a file being read)
+        by chunks and yields the problems of each text in the order
+        of the texts as soon as its chunk is checked, so only the problems
+        of one chunk are held in memory
+        '''
+        chunk_size = chunk_size or self.STREAM_CHUNK_SIZE
+        texts = iter(texts)
+        while True:
+            chunk = list(itertools.islice(texts, chunk_size))
+            if not chunk:
+                return
+            yield from self.__check_job(self._prepare_texts(chunk, chosen_aspects))
+            
+    def __attach_restored(self, texts, texts_problems):
+        '''
+        Gives the problems restored from a manifest to the checkers,
+        which build their options and context
+        '''
+        sentences = {}
+        for text, problems in zip(texts, texts_problems):
+            for problem in problems or []:
+                checker = (self.spell_checker if problem['type'] == 'spelling'
+                           else self.typography_checker)
+                problem.attach(checker, text, sentences)
+    
+    def __spread(self, texts, unique_texts, unique_problems):
+        '''
+        Gives the problems of the unique texts to all their copies
+        '''
+        checked = dict(zip(unique_texts, unique_problems))
+        texts_problems = []
+        given = set()
+        for text in texts:
+            problems = checked[text]
+            if text in given:
+                problems = [copy(problem) for problem in problems]
+            given.add(text)
+            texts_problems.append(problems)
+        return texts_problems
+        
     def __check_aspect(self, texts, checker, var):
         if var:
             return checker.find_problems(texts)
@@ -679,5 +2594,1086 @@ class AspectCheckerManager:
         return sorted(problems, key=lambda x: x['pos'])
     
     
+class BackgroundCheck:
+    '''
+    Checks a file in a worker thread by AspectCheckerManager.set_problems_by_chunks.
+    Tk can be used only from its own thread, so the results are put into
+    a queue, which the window reads (take_events):
+    ('texts', (index of the first text, problems of the texts)) and at the end
+    ('finished', None / 'cancelled' / the text of the error)
+    '''
+    
+    def __init__(self, manager, file_to_check, chosen_aspects, manifest=None,
+                 chunk_size=16):
+        self.manager = manager
+        self.events = queue.Queue()
+        self.__cancel_event = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True,
+                                         args=(file_to_check, chosen_aspects,
+                                               manifest, chunk_size))
+        
+    def start(self):
+        self.__thread.start()
+        return self
+    
+    def cancel(self):
+        '''
+        The checking stops after the current chunk
+        '''
+        self.__cancel_event.set()
+        
+    def requests_in_flight(self):
+        return getattr(self.manager.spell_checker.client, 'in_flight', 0)
+    
+    def take_events(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+            
+    def __run(self, file_to_check, chosen_aspects, manifest, chunk_size):
+        on_chunk = lambda start, problems: self.events.put(('texts', (start, problems)))
+        try:
+            completed = self.manager.set_problems_by_chunks(file_to_check, chosen_aspects,
+                                                            manifest, on_chunk,
+                                                            self.__cancel_event, chunk_size)
+            if manifest is not None:
+                manifest.save()
+            result = None if completed else 'cancelled'
+        except Exception as error:
+            result = '{}: {}'.format(type(error).__name__, error)
+        self.events.put(('finished', result))
+        
+        
+class PipelinedCheckerManager(AspectCheckerManager):
+    '''
+    Checks a stream of files in stages, which work at the same time:
+    extraction of the texts -> spelling || typography -> merging and finishing
+    (e.g. correction and saving). The stages are joined by bounded queues,
+    each stage has its own number of threads. The problems are the same
+    as the ones of set_problems.
+    With chunk_size the texts of a file go through the stages by chunks
+    (as in set_problems_by_chunks) and the manifest of the file is saved
+    after each merged chunk, so a journal keeps the checked part of a file
+    which is not finished
+    '''
+    
+    def __init__(self, spell_checker=None, typography_checker=None,
+                 extract_workers=1, typography_workers=1, spelling_workers=2,
+                 finish_workers=1, queue_size=4, chunk_size=None):
+        super().__init__(spell_checker, typography_checker)
+        if min(extract_workers, typography_workers, spelling_workers, finish_workers) < 1:
+            raise ValueError('У каждого этапа должен быть хотя бы один поток')
+        self.extract_workers = extract_workers
+        self.typography_workers = typography_workers
+        self.spelling_workers = spelling_workers
+        self.finish_workers = finish_workers
+        self.queue_size = queue_size
+        self.chunk_size = chunk_size
+        
+    def run(self, items, load, chosen_aspects, finish=None):
+        '''
+        load(item) returns the file checker (AbstractFileChecker, its manifest
+        is used as in set_problems), finish(item, file_to_check) is called
+        after its problems are set.
+        Yields (index, item, result of finish, exception or None)
+        in the order of completion
+        '''
+        extract_queue = queue.Queue(self.queue_size)
+        spelling_queue = queue.Queue(self.queue_size)
+        typography_queue = queue.Queue(self.queue_size)
+        finish_queue = queue.Queue(self.queue_size)
+        output_queue = queue.Queue(self.queue_size)
+        
+        def feed():
+            for index, item in enumerate(items):
+                extract_queue.put({'index': index, 'item': item, 'error': None,
+                                   'waiting': 2, 'lock': threading.Lock()})
+                
+        def pass_on(task):
+            spelling_queue.put(task)
+            typography_queue.put(task)
+            
+        def extract(task):
+            if self.chunk_size:
+                extract_chunks(task)
+                return
+            try:
+                file_to_check = load(task['item'])
+                task.update(self._prepare(file_to_check, chosen_aspects,
+                                          file_to_check.manifest))
+            except Exception as error:
+                task['error'] = error
+            pass_on(task)
+            
+        def chunk_tasks(file_task):
+            '''
+            Yields the tasks of the chunks of the file (one empty chunk
+            if the file has no texts), the last one gets the error
+            of loading or reading the file
+            '''
+            start = 0
+            try:
+                file_to_check = load(file_task['item'])
+                file_task['file'] = file_to_check
+                texts = file_to_check.iter_texts_to_checker()
+                while True:
+                    chunk = list(itertools.islice(texts, self.chunk_size))
+                    if start and not chunk:
+                        return
+                    task = {'file_task': file_task, 'start': start, 'error': None,
+                            'waiting': 2, 'lock': threading.Lock()}
+                    task.update(self._prepare_texts(chunk, chosen_aspects,
+                                                    file_to_check.manifest,
+                                                    file_task['checked']))
+                    yield task
+                    if not chunk:
+                        return
+                    start += len(chunk)
+            except Exception as error:
+                yield {'file_task': file_task, 'start': start, 'error': error,
+                       'waiting': 2, 'lock': threading.Lock()}
+                
+        def extract_chunks(file_task):
+            file_task.update(checked={}, chunks=None, merged=0, problems={})
+            tasks = chunk_tasks(file_task)
+            task = next(tasks)
+            count = 1
+            for next_task in tasks:
+                pass_on(task)
+                task = next_task
+                count += 1
+            ## Before the last chunk, so the finishing of the last merged one sees it
+            file_task['chunks'] = count
+            pass_on(task)
+            
+        def check(aspect):
+            def check_task(task):
+                if task['error'] is None:
+                    try:
+                        task[aspect] = self._check_aspect(task, aspect)
+                    except Exception as error:
+                        task['error'] = error
+                with task['lock']: ##The last of the two aspects passes the task on
+                    task['waiting'] -= 1
+                    if task['waiting']:
+                        return
+                finish_queue.put(task)
+            return check_task
+        
+        def finish_chunk(task):
+            file_task = task['file_task']
+            with file_task['lock']:
+                ## The checked chunks are saved even if another chunk failed
+                error = task['error']
+                if error is None:
+                    try:
+                        file_task['problems'][task['start']] = self._merge_texts(
+                            task, task[SPELLING_ASPECT], task[TYPOGRAPHY_ASPECT])
+                        if task['manifest'] is not None:
+                            task['manifest'].save()
+                    except Exception as merge_error:
+                        error = merge_error
+                if file_task['error'] is None:
+                    file_task['error'] = error
+                file_task['merged'] += 1
+                if file_task['merged'] != file_task['chunks']:
+                    return
+            result = None
+            if file_task['error'] is None:
+                try:
+                    file_task['file'].set_texts_problems(
+                        [problems for start in sorted(file_task['problems'])
+                         for problems in file_task['problems'][start]])
+                    if finish is not None:
+                        result = finish(file_task['item'], file_task['file'])
+                except Exception as error:
+                    file_task['error'] = error
+            output_queue.put((file_task['index'], file_task['item'], result,
+                              file_task['error']))
+            
+        def finish_task(task):
+            if 'file_task' in task:
+                finish_chunk(task)
+                return
+            result = None
+            if task['error'] is None:
+                try:
+                    self._merge(task, task[SPELLING_ASPECT], task[TYPOGRAPHY_ASPECT])
+                    if finish is not None:
+                        result = finish(task['item'], task['file'])
+                except Exception as error:
+                    task['error'] = error
+            output_queue.put((task['index'], task['item'], result, task['error']))
+            
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        ## (threads of a stage, [(next queue, number of its threads)])
+        stages = [([feeder], [(extract_queue, self.extract_workers)]),
+                  (self.__start(self.extract_workers, extract_queue, extract),
+                   [(spelling_queue, self.spelling_workers),
+                    (typography_queue, self.typography_workers)]),
+                  (self.__start(self.spelling_workers, spelling_queue,
+                                check(SPELLING_ASPECT)) +
+                   self.__start(self.typography_workers, typography_queue,
+                                check(TYPOGRAPHY_ASPECT)),
+                   [(finish_queue, self.finish_workers)]),
+                  (self.__start(self.finish_workers, finish_queue, finish_task),
+                   [(output_queue, 1)])]
+        for threads, next_queues in stages:
+            threading.Thread(target=self.__close_after, args=(threads, next_queues),
+                             daemon=True).start()
+        while True:
+            output = output_queue.get()
+            if output is None:
+                break
+            yield output
+            
+    def __start(self, count, task_queue, handle):
+        threads = [threading.Thread(target=self.__work, args=(task_queue, handle),
+                                    daemon=True)
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+    
+    def __work(self, task_queue, handle):
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+            handle(task)
+            
+    def __close_after(self, threads, next_queues):
+        '''
+        When the threads of a stage end, sends the end marks to the next stage
+        (one for each thread of the next stage)
+        '''
+        for thread in threads:
+            thread.join()
+        for next_queue, count in next_queues:
+            for i in range(count):
+                next_queue.put(None)
+                
+    
+class Decisions:
+    '''
+    The choices made during a review, saved to be replayed later.
+    A choice is identified by the hash of the text, the position and
+    the type of the problem, the chosen replacement is stored
+    (None - 'do not correct'), so the order of the options does not matter
+    '''
+    
+    SUFFIX = '.decisions.json'
+    
+    def __init__(self, path):
+        self.path = path
+        self.__choices = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for decision in json.load(f):
+                    key = (decision['hash'], decision['pos'], decision['type'])
+                    self.__choices[key] = decision['replacement']
+                    
+    @classmethod
+    def for_file(cls, file_path):
+        return cls(file_path + cls.SUFFIX)
+    
+    def __key(self, text, problem):
+        return (hashlib.sha256(text.encode('utf-8')).hexdigest(),
+                problem['pos'], problem['type'])
+    
+    def record_file(self, file_to_check):
+        '''
+        Stores the choices of all the problems of the checked file
+        '''
+        texts = file_to_check.texts_to_checker()
+        for text, text_problems in zip(texts, file_to_check.problems_to_show()):
+            for problem in text_problems[0]:
+                if 'choice' in problem:
+                    choice = problem['choice']
+                    self.__choices[self.__key(text, problem)] = \
+                        problem['s'][choice] if choice < len(problem['s']) else None
+                    
+    def lookup(self, text, problem):
+        '''
+        Returns the saved choice for the problem or None
+        '''
+        key = self.__key(text, problem)
+        if key not in self.__choices:
+            return None
+        replacement = self.__choices[key]
+        if replacement is None:
+            return len(problem['s'])
+        if replacement in problem['s']:
+            return problem['s'].index(replacement)
+        return None
+    
+    def save(self):
+        decisions = [{'hash': key[0], 'pos': key[1], 'type': key[2],
+                      'replacement': replacement}
+                     for key, replacement in self.__choices.items()]
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(decisions, f, ensure_ascii=False)
+            
+
+class CorrectionPolicy:
+    '''
+    Chooses the corrections without the user. The replayed decisions
+    come first, then the rule for the type of the problem
+    (the method _choose_<type>). Problems without a rule
+    are not corrected
+    '''
+    
+    def __init__(self, spelling_threshold=0.8, fix_hyphens=True, decisions=None):
+        self.spelling_threshold = spelling_threshold
+        self.fix_hyphens = fix_hyphens
+        self.decisions = decisions
+        
+    def choose(self, text, problem):
+        if self.decisions is not None:
+            choice = self.decisions.lookup(text, problem)
+            if choice is not None:
+                return choice
+        rule = getattr(self, '_choose_' + problem['type'], None)
+        choice = rule(problem) if rule is not None else None
+        return len(problem['s']) if choice is None else choice
+    
+    def _choose_quotation_type(self, problem):
+        '''
+        The first option is always the right quote («» outside, „“ inside)
+        '''
+        return 0
+    
+    def _choose_dash_between_digits(self, problem):
+        return problem['s'].index('–')
+    
+    def _choose_hypher_between_spaces(self, problem):
+        return problem['s'].index(' — ') if self.fix_hyphens else None
+    
+    def _choose_spelling(self, problem):
+        '''
+        The first suggestion is taken if it is similar enough to the word
+        '''
+        if not problem['s']:
+            return None
+        similarity = difflib.SequenceMatcher(None, problem['word'].lower(),
+                                             problem['s'][0].lower()).ratio()
+        return 0 if similarity >= self.spelling_threshold else None
+    
+    def apply(self, file_to_check):
+        '''
+        Sets the choice of every problem, which has not been decided yet.
+        Returns the number of the problems to correct
+        '''
+        corrections = 0
+        texts = file_to_check.texts_to_checker()
+        for text, text_problems in zip(texts, file_to_check.problems_to_show()):
+            for problem in text_problems[0]:
+                if 'choice' not in problem:
+                    problem['choice'] = self.choose(text, problem)
+                if problem['choice'] < len(problem['s']):
+                    corrections += 1
+        return corrections
+
+
+PROBLEM_RECORD_KEYS = ('type', 'pos', 'len', 'word', 's')
+
+_batch_manager = None
+_batch_journal = None
+_findings_queue = None
+
+
+def _create_spell_checker(options):
+    speller_options = dict(options['speller_options'])
+    local_index = speller_options.pop('local_index', None)
+    user_dictionary = speller_options.pop('user_dictionary', None)
+    skip_patterns = None if speller_options.pop('prefilter', True) else ()
+    if local_index:
+        speller_client = LocalSpeller(local_index)
+    else:
+        speller_client = SpellerClient(**speller_options)
+    spell_cache_path = options['spell_cache_path']
+    spell_cache = SpellCache(spell_cache_path) if spell_cache_path else None
+    if user_dictionary:
+        prefilter = SpellPrefilter.from_file(user_dictionary, skip_patterns=skip_patterns)
+    else:
+        prefilter = SpellPrefilter(skip_patterns=skip_patterns)
+    return SpellChecker(speller_client, spell_cache, prefilter)
+
+
+def _get_batch_manager(options):
+    '''
+    Returns AspectCheckerManager of the worker process, creates it
+    on the first call
+    '''
+    global _batch_manager
+    if _batch_manager is None:
+        _batch_manager = AspectCheckerManager(_create_spell_checker(options))
+    return _batch_manager
+
+
+def _get_batch_journal(options):
+    global _batch_journal
+    if _batch_journal is None or _batch_journal.path != options['journal_path']:
+        _batch_journal = BatchJournal(options['journal_path'])
+    return _batch_journal
+
+
+def _journal_job_key(options):
+    '''
+    Returns the key of the options, on which the results of the files depend
+    (the problems of the texts are kept by AspectCheckerManager.config_key)
+    '''
+    texts_key = json.dumps(options['speller_options'], sort_keys=True)
+    policy = options['policy']
+    job_key = json.dumps({'texts': texts_key, 'aspects': sorted(options['chosen_aspects']),
+                          'include_templates': options['include_templates'],
+                          'policy': None if policy is None else [policy.spelling_threshold,
+                                                                 policy.fix_hyphens],
+                          'decisions_path': options['decisions_path']}, sort_keys=True)
+    return job_key
+
+
+def _warm_batch_worker(options):
+    '''
+    Initializer of the worker processes of CheckerService: creates
+    the manager and loads the heavy modules before the first request
+    '''
+    _get_batch_manager(options)
+    try:
+        pptx.Presentation
+        sent_tokenize('Загрузка. Токенизатора.', 'russian')
+    except (ImportError, LookupError):
+        pass
+
+
+def _set_findings_queue(findings_queue):
+    '''
+    Initializer of the worker processes of BatchChecker in JSONL mode
+    '''
+    global _findings_queue
+    _findings_queue = findings_queue
+    
+    
+def _problem_record(file_path, text_id, location, problem):
+    '''
+    text_id - the index of the text in the file; the slides are counted
+    from 0 as in the location
+    '''
+    record = {'file': file_path, 'slide': location['slide'], 'text': text_id,
+              'location': location}
+    record.update({key: problem[key] for key in PROBLEM_RECORD_KEYS if key in problem})
+    return record
+
+
+def _load_file_for_batch(file_path, options, config_key):
+    '''
+    config_key - the fingerprint of the checkers, see AspectCheckerManager.config_key
+    '''
+    ## StreamingPptxChecker can not correct the file
+    if options['streaming'] and options['policy'] is None:
+        file_to_check = StreamingPptxChecker(file_path, use_mmap=True,
+                                             include_templates=options['include_templates'])
+    else:
+        file_to_check = PptxChecker(file_path,
+                                    include_templates=options['include_templates'])
+    if options['incremental']:
+        file_to_check.manifest = CheckManifest.for_file(file_path, config_key)
+    if options['journal_path']:
+        file_to_check.manifest = _get_batch_journal(options).texts(config_key,
+                                                                   file_to_check.manifest)
+    return file_to_check
+
+
+def _finish_file_for_batch(file_to_check, result, options, texts_problems=None):
+    '''
+    Corrects the checked file (if there is a policy), saves its manifest
+    and adds its problems to the result (or sends them to the findings queue).
+    With a journal the result is saved to it.
+    texts_problems - the problems of the texts, if they are not set to the file
+    '''
+    policy = options['policy']
+    if texts_problems is None:
+        if policy is not None:
+            if options['decisions_path']:
+                policy.decisions = Decisions(options['decisions_path'])
+            result['corrections'] = policy.apply(file_to_check)
+            file_to_check.correct()
+            result['corrected_file'] = file_to_check.corrected_path
+        elif file_to_check.manifest is not None:
+            file_to_check.manifest.save()
+        texts_problems = (problems[0] for problems in file_to_check.problems_to_show())
+    locations = file_to_check.text_locations()
+    records = result['problems'] if 'problems' in result else []
+    keep_records = 'problems' in result or options['journal_path']
+    for text_id, problems in enumerate(texts_problems):
+        for problem in problems:
+            record = _problem_record(result['file'], text_id, locations[text_id], problem)
+            if options['jsonl']:
+                _findings_queue.put(json.dumps(record, ensure_ascii=False))
+            if keep_records:
+                del record['file']
+                records.append(record)
+        result['problems_count'] += len(problems)
+    if options['journal_path']:
+        journal = _get_batch_journal(options)
+        journal.finish_file(result['file'],
+                            journal.file_signature(result['file'], _journal_job_key(options)),
+                            dict(result, problems=records))
+    return result
+
+
+def _new_batch_result(file_path, options):
+    result = {'file': file_path, 'problems_count': 0, 'error': None}
+    if not options['jsonl']:
+        result['problems'] = []
+    return result
+
+
+def _check_file_for_batch(file_path, options):
+    '''
+    Checks a single file in a worker process of BatchChecker
+    (options - see BatchChecker.worker_options).
+    Returns plain data, which can be sent back to the main process
+    '''
+    batch_manager = _get_batch_manager(options)
+    result = _new_batch_result(file_path, options)
+    METRICS.enabled = options['collect_metrics']
+    METRICS.reset()
+    start = time.perf_counter()
+    try:
+        file_to_check = _load_file_for_batch(file_path, options, batch_manager.config_key())
+        texts_problems = None
+        if (options['jsonl'] and file_to_check.manifest is None
+                and options['policy'] is None):
+            ## The problems are emitted as soon as their chunk is checked
+            texts_problems = batch_manager.iter_problems(file_to_check.iter_texts_to_checker(),
+                                                         options['chosen_aspects'])
+        elif options['journal_path']:
+            ## Each checked chunk is saved, a restarted job continues after it
+            journal_texts = file_to_check.manifest
+            batch_manager.set_problems_by_chunks(file_to_check, options['chosen_aspects'],
+                                                 journal_texts,
+                                                 lambda start, problems: journal_texts.save())
+        else:
+            batch_manager.set_problems(file_to_check, options['chosen_aspects'],
+                                       file_to_check.manifest)
+        _finish_file_for_batch(file_to_check, result, options, texts_problems)
+    except Exception as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    result['seconds'] = time.perf_counter() - start
+    if options['collect_metrics']:
+        result['metrics'] = METRICS.snapshot()
+    return result
+
+
+class BatchChecker:
+    '''
+    Checks many files without GUI. The files are distributed between
+    the processes of a pool, the results are collected in the input order.
+    If METRICS is enabled, the metrics of the workers are added to it.
+    With policy (CorrectionPolicy) the files are corrected without the user
+    and saved as "old_name_corrected"; decisions_path is a decision file
+    of an earlier review to replay.
+    If jsonl_output (a text file) is given, the problems are not collected
+    in the report but written to it as JSON lines as soon as they are found
+    (the problems of a file are in the order of its shapes).
+    If pipeline (a dict of the arguments of PipelinedCheckerManager, e.g.
+    {'spelling_workers': 4}) is given, the files are checked in this process
+    by PipelinedCheckerManager instead of the pool of processes.
+    If journal_path is given, the checked texts and files are saved
+    to a BatchJournal there, and a restarted job does not check again
+    the unchanged files and the already checked texts
+    '''
+    
+    JSONL_QUEUE_SIZE = 10000
+    
+    def __init__(self, chosen_aspects=ALL_ASPECTS, workers=None,
+                 speller_options=None, spell_cache_path=None, streaming=False,
+                 incremental=False, include_templates=False, policy=None,
+                 decisions_path=None, jsonl_output=None, pipeline=None, journal_path=None):
+        self.chosen_aspects = list(chosen_aspects)
+        self.workers = workers
+        self.speller_options = speller_options or {}
+        self.spell_cache_path = spell_cache_path
+        self.streaming = streaming
+        self.incremental = incremental
+        self.include_templates = include_templates
+        self.policy = policy
+        self.decisions_path = decisions_path
+        self.jsonl_output = jsonl_output
+        self.pipeline = pipeline
+        self.journal_path = journal_path
+        
+    def worker_options(self):
+        return {'chosen_aspects': self.chosen_aspects,
+                'speller_options': self.speller_options,
+                'spell_cache_path': self.spell_cache_path,
+                'streaming': self.streaming,
+                'incremental': self.incremental,
+                'include_templates': self.include_templates,
+                'policy': self.policy,
+                'decisions_path': self.decisions_path,
+                'jsonl': self.jsonl_output is not None,
+                'journal_path': self.journal_path,
+                'collect_metrics': METRICS.enabled}
+    
+    def collect_files(self, paths):
+        '''
+        Expands directories (recursively) and glob patterns
+        into a sorted list of .pptx files
+        '''
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                ## The results of the earlier corrections are not checked
+                candidates = [candidate for candidate in
+                              glob.glob(os.path.join(path, '**', '*.pptx'), recursive=True)
+                              if not os.path.splitext(candidate)[0].endswith('_corrected')]
+            else:
+                candidates = glob.glob(path, recursive=True) or [path]
+            for candidate in sorted(candidates):
+                ## Office lock files look like '~$name.pptx'
+                if os.path.basename(candidate).startswith('~$'):
+                    continue
+                if candidate not in files:
+                    files.append(candidate)
+        return files
+    
+    def check(self, paths, on_result=None):
+        '''
+        Checks all the files and returns the report: per-file results
+        and aggregate throughput.
+        on_result is called with each per-file result as soon as it is ready
+        '''
+        files = self.collect_files(paths)
+        results = [None] * len(files)
+        options = self.worker_options()
+        start = time.perf_counter()
+        findings_queue = None
+        if self.jsonl_output is not None:
+            ## Bounded, so the workers wait if the output is slow
+            queue_class = multiprocessing.Queue if self.pipeline is None else queue.Queue
+            findings_queue = queue_class(self.JSONL_QUEUE_SIZE)
+            writer = threading.Thread(target=self.__write_findings, args=(findings_queue,))
+            writer.start()
+        try:
+            pending = list(enumerate(files))
+            resumed = []
+            if self.journal_path is not None:
+                pending, resumed = self.__split_finished(pending, options)
+            for index, result in resumed:
+                if findings_queue is not None:
+                    for record in result.pop('problems'):
+                        findings_queue.put(json.dumps(dict(record, file=result['file']),
+                                                      ensure_ascii=False))
+                results[index] = result
+                if on_result is not None:
+                    on_result(result)
+            if self.pipeline is None:
+                checked = self.__check_in_processes(pending, options, findings_queue)
+            else:
+                _set_findings_queue(findings_queue)
+                checked = self.__check_pipelined(pending, options)
+            for index, result in checked:
+                results[index] = result
+                if 'metrics' in result:
+                    METRICS.merge(result.pop('metrics'))
+                if on_result is not None:
+                    on_result(result)
+        finally:
+            if self.jsonl_output is not None:
+                findings_queue.put(None)
+                writer.join()
+        elapsed = time.perf_counter() - start
+        return {'files': results,
+                'files_count': len(files),
+                'failed_count': sum(1 for result in results if result['error']),
+                'problems_count': sum(result['problems_count'] for result in results),
+                'seconds': elapsed,
+                'decks_per_second': len(files) / elapsed if elapsed else 0.0}
+    
+    def __split_finished(self, indexed_files, options):
+        '''
+        Splits the (index, path) pairs into the pending ones and the results
+        of the files, finished by an earlier run of the job
+        '''
+        journal = BatchJournal(self.journal_path)
+        job_key = _journal_job_key(options)
+        pending = []
+        resumed = []
+        try:
+            for index, file_path in indexed_files:
+                result = None
+                if os.path.exists(file_path):
+                    result = journal.finished_result(file_path,
+                                                     journal.file_signature(file_path, job_key))
+                if result is None:
+                    pending.append((index, file_path))
+                else:
+                    result.update(resumed=True, seconds=0.0)
+                    resumed.append((index, result))
+        finally:
+            journal.close()
+        return pending, resumed
+    
+    def __check_in_processes(self, indexed_files, options, findings_queue):
+        pool_options = {}
+        if findings_queue is not None:
+            pool_options = {'initializer': _set_findings_queue,
+                            'initargs': (findings_queue,)}
+        with ProcessPoolExecutor(max_workers=self.workers, **pool_options) as executor:
+            futures = {executor.submit(_check_file_for_batch, file_path, options): index
+                       for index, file_path in indexed_files}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+                
+    def __check_pipelined(self, indexed_files, options):
+        pipeline = dict(self.pipeline)
+        if options['journal_path']: ##Each checked chunk is saved to the journal
+            pipeline.setdefault('chunk_size', AspectCheckerManager.STREAM_CHUNK_SIZE)
+        manager = PipelinedCheckerManager(_create_spell_checker(options), **pipeline)
+        config_key = manager.config_key()
+        starts = {}
+        
+        def load(file_path):
+            starts[file_path] = time.perf_counter()
+            return _load_file_for_batch(file_path, options, config_key)
+        
+        def finish(file_path, file_to_check):
+            return _finish_file_for_batch(file_to_check,
+                                          _new_batch_result(file_path, options), options)
+        
+        files = [file_path for index, file_path in indexed_files]
+        for position, file_path, result, error in manager.run(files, load,
+                                                              options['chosen_aspects'], finish):
+            if error is not None:
+                result = _new_batch_result(file_path, options)
+                result['error'] = '{}: {}'.format(type(error).__name__, error)
+            result['seconds'] = time.perf_counter() - starts.pop(file_path)
+            yield indexed_files[position][0], result
+    
+    def __write_findings(self, findings_queue):
+        output = self.jsonl_output
+        while True:
+            line = findings_queue.get()
+            if line is None:
+                break
+            if output is None: ##The queue is emptied anyway, so the workers do not wait
+                continue
+            try:
+                output.write(line + '\n')
+                if findings_queue.empty():
+                    output.flush()
+            except BrokenPipeError:
+                output = None
+        if output is not None:
+            output.flush()
+
+
+class CheckerService:
+    '''
+    Local HTTP service, which checks the presentations in a pool of
+    worker processes with warm AspectCheckerManager instances.
+    POST /check (body - .pptx file; parameters: aspects=spelling,typography,
+    correct=1 - correct by CorrectionPolicy and return the file in base64)
+    returns the same JSON as a file of BatchChecker report.
+    At most workers+queue_size files are accepted at once, the others
+    get 503 with Retry-After.
+    GET /health, GET /queue - the state, GET /metrics - METRICS
+    in Prometheus format
+    '''
+    
+    ASPECT_NAMES = {'spelling': SPELLING_ASPECT, 'typography': TYPOGRAPHY_ASPECT}
+    
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, queue_size=16,
+                 worker_options=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        ## The findings are returned in the answer, not written as JSON lines
+        self.worker_options = dict(worker_options or BatchChecker().worker_options(),
+                                   jsonl=False, collect_metrics=True)
+        METRICS.enabled = True
+        self.accepted = 0
+        self.processed = 0
+        self.rejected = 0
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(self.workers + queue_size)
+        self.__executor = ProcessPoolExecutor(max_workers=self.workers,
+                                              initializer=_warm_batch_worker,
+                                              initargs=(self.worker_options,))
+        ## Warm up all the workers before the first request
+        for future in [self.__executor.submit(time.sleep, 0.1) for i in range(self.workers)]:
+            future.result()
+        from http.server import ThreadingHTTPServer
+        self.server = ThreadingHTTPServer((host, port), self.__make_handler())
+        self.server.daemon_threads = True
+        
+    def state(self):
+        with self.__lock:
+            in_work = self.accepted - self.processed
+            return {'workers': self.workers, 'queue_size': self.queue_size,
+                    'in_work': in_work, 'queue_depth': max(0, in_work - self.workers),
+                    'accepted': self.accepted, 'processed': self.processed,
+                    'rejected': self.rejected}
+        
+    def check(self, data, aspects, correct):
+        '''
+        Checks the file given as bytes. Returns None if the service is overloaded
+        '''
+        if not self.__slots.acquire(blocking=False):
+            with self.__lock:
+                self.rejected += 1
+            return None
+        with self.__lock:
+            self.accepted += 1
+        directory = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(directory, 'deck.pptx')
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            options = dict(self.worker_options, chosen_aspects=aspects,
+                           policy=CorrectionPolicy() if correct else None,
+                           incremental=False)
+            result = self.__executor.submit(_check_file_for_batch, file_path,
+                                            options).result()
+            if 'metrics' in result:
+                METRICS.merge(result.pop('metrics'))
+            if result.get('corrected_file'):
+                with open(result['corrected_file'], 'rb') as f:
+                    result['corrected_file'] = base64.b64encode(f.read()).decode('ascii')
+            result['file'] = None
+            return result
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            with self.__lock:
+                self.processed += 1
+            self.__slots.release()
+            
+    def __make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        service = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = urllib.parse.urlsplit(self.path).path
+                if path == '/health':
+                    self.send_json(200, {'status': 'ok'})
+                elif path == '/queue':
+                    self.send_json(200, service.state())
+                elif path == '/metrics':
+                    self.send_data(200, METRICS.to_prometheus().encode('utf-8'),
+                                   'text/plain; version=0.0.4')
+                else:
+                    self.send_json(404, {'error': 'not found'})
+                    
+            def do_POST(self):
+                url = urllib.parse.urlsplit(self.path)
+                if url.path != '/check':
+                    self.send_json(404, {'error': 'not found'})
+                    return
+                query = urllib.parse.parse_qs(url.query)
+                aspects = query.get('aspects', ['spelling,typography'])[0].split(',')
+                if not set(aspects) <= set(service.ASPECT_NAMES):
+                    self.send_json(400, {'error': 'unknown aspect'})
+                    return
+                try:
+                    length = int(self.headers.get('Content-Length', 0))
+                except ValueError:
+                    length = 0
+                if length <= 0:
+                    self.send_json(400, {'error': 'empty body'})
+                    return
+                data = self.rfile.read(length)
+                result = service.check(data, [service.ASPECT_NAMES[aspect] for aspect in aspects],
+                                       query.get('correct', ['0'])[0] == '1')
+                if result is None:
+                    self.send_json(503, {'error': 'overloaded'}, {'Retry-After': '1'})
+                else:
+                    self.send_json(200, result)
+                    
+            def send_json(self, status, data, headers=None):
+                self.send_data(status, json.dumps(data, ensure_ascii=False).encode('utf-8'),
+                               'application/json; charset=utf-8', headers)
+                
+            def send_data(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+                
+            def log_message(self, *args):
+                pass
+            
+        return Handler
+    
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+            
+    def close(self):
+        self.server.server_close()
+        self.__executor.shutdown()
+
+
+def _print_batch_result(result, output=None):
+    if result['error']:
+        print('{}: ошибка: {}'.format(result['file'], result['error']), file=output)
+    elif result.get('resumed'):
+        print('{}: найдено проблем: {} (из журнала)'.format(
+            result['file'], result['problems_count']), file=output)
+    else:
+        print('{}: найдено проблем: {} ({:.2f} с)'.format(
+            result['file'], result['problems_count'], result['seconds']), file=output)
+        if 'corrected_file' in result:
+            print('    исправлено: {}, сохранено в {}'.format(
+                result['corrections'], result['corrected_file']), file=output)
+
+
+def _parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Проверка орфографии и типографики презентаций .pptx. '
+                    'Без аргументов запускается графический интерфейс.')
+    parser.add_argument('paths', nargs='*',
+                        help='файлы, папки или шаблоны (glob) для проверки без GUI')
+    parser.add_argument('--aspects', nargs='+', default=['spelling', 'typography'],
+                        choices=['spelling', 'typography'],
+                        help='аспекты проверки')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='число процессов (по умолчанию по числу ядер)')
+    parser.add_argument('--report', default=None,
+                        help='путь к JSON-отчёту')
+    parser.add_argument('--jsonl', default=None, metavar='PATH',
+                        help='писать найденные проблемы в файл JSON Lines по мере '
+                             'их нахождения ("-" - стандартный вывод)')
+    parser.add_argument('--speller-url', default=SpellerClient.DEFAULT_URL,
+                        help='адрес метода checkTexts сервиса проверки орфографии')
+    parser.add_argument('--max-in-flight', type=int, default=4,
+                        help='число одновременных запросов к сервису орфографии')
+    parser.add_argument('--local-dictionary', default=None,
+                        help='проверять орфографию без сети по индексу словаря '
+                             '(см. --build-dictionary-index)')
+    parser.add_argument('--build-dictionary-index', default=None,
+                        help='построить индекс словаря по этому пути из частотных '
+                             'словарей, переданных вместо файлов ("слово частота" в строке)')
+    parser.add_argument('--user-dictionary', default=None,
+                        help='файл со словами (по одному в строке), которые не считаются '
+                             'опечатками, например глоссарий компании')
+    parser.add_argument('--no-prefilter', action='store_true',
+                        help='отправлять в сервис орфографии ссылки, адреса почты, '
+                             'числа и коды')
+    parser.add_argument('--spell-cache', default=None,
+                        help='путь к файлу кэша результатов проверки орфографии (SQLite)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='читать текст слайдов прямо из XML, не загружая '
+                             'презентацию целиком (меньше памяти на больших файлах)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='проверять только изменившиеся фигуры, результаты '
+                             'остальных брать из файла "<презентация>.check.json"')
+    parser.add_argument('--auto-correct', action='store_true',
+                        help='исправить ошибки без участия пользователя и сохранить '
+                             'файлы "старое_название_corrected"')
+    parser.add_argument('--decisions', default=None,
+                        help='файл решений предыдущей проверки ("<презентация>.decisions.json"), '
+                             'которые нужно повторить (включает --auto-correct)')
+    parser.add_argument('--spelling-threshold', type=float, default=0.8,
+                        help='минимальное сходство слова и первого варианта исправления '
+                             'для автоматического исправления орфографии')
+    parser.add_argument('--keep-hyphens', action='store_true',
+                        help='не заменять автоматически дефис между пробелами на тире')
+    parser.add_argument('--serve', default=None, metavar='[HOST:]PORT',
+                        help='запустить HTTP-сервис проверки (POST /check, GET /health, '
+                             '/queue, /metrics)')
+    parser.add_argument('--pipeline', nargs='?', const='1,1,2,1', default=None,
+                        metavar='E,T,S,F',
+                        help='проверять файлы в одном процессе конвейером: число потоков '
+                             'извлечения текстов, типографики, орфографии и '
+                             'исправления/сохранения (по умолчанию 1,1,2,1)')
+    parser.add_argument('--journal', default=None, metavar='PATH',
+                        help='журнал задания (SQLite): при повторном запуске уже проверенные '
+                             'файлы и тексты не проверяются снова')
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help='сколько файлов сервис держит в очереди сверх числа процессов')
+    parser.add_argument('--templates', action='store_true',
+                        help='проверять также образцы и макеты слайдов')
+    parser.add_argument('--metrics-json', default=None,
+                        help='путь к JSON-файлу с временем этапов и счётчиками')
+    parser.add_argument('--metrics-prom', default=None,
+                        help='путь к файлу с теми же метриками в текстовом формате Prometheus')
+    arguments = parser.parse_args(argv)
+    if arguments.serve is not None and arguments.jsonl:
+        parser.error('--jsonl нельзя использовать вместе с --serve: сервис возвращает '
+                     'проблемы в ответе')
+    return arguments
+
+
+def main(argv=None):
+    arguments = _parse_arguments(argv)
+    if arguments.build_dictionary_index:
+        LocalSpeller.build_index(arguments.paths, arguments.build_dictionary_index)
+        return
+    if not arguments.paths and arguments.serve is None:
+        PptxCheckerRoot()
+        return
+    aspect_names = {'spelling': SPELLING_ASPECT, 'typography': TYPOGRAPHY_ASPECT}
+    chosen_aspects = [aspect_names[aspect] for aspect in arguments.aspects]
+    speller_options = {'url': arguments.speller_url,
+                       'max_in_flight': arguments.max_in_flight,
+                       'local_index': arguments.local_dictionary,
+                       'user_dictionary': arguments.user_dictionary,
+                       'prefilter': not arguments.no_prefilter}
+    METRICS.enabled = bool(arguments.metrics_json or arguments.metrics_prom)
+    policy = None
+    if arguments.auto_correct or arguments.decisions:
+        policy = CorrectionPolicy(arguments.spelling_threshold,
+                                  not arguments.keep_hyphens)
+    batch_checker = BatchChecker(chosen_aspects, arguments.workers,
+                                 speller_options, arguments.spell_cache,
+                                 arguments.streaming, arguments.incremental,
+                                 include_templates=arguments.templates,
+                                 policy=policy, decisions_path=arguments.decisions,
+                                 journal_path=arguments.journal)
+    if arguments.pipeline:
+        batch_checker.pipeline = dict(zip(('extract_workers', 'typography_workers',
+                                           'spelling_workers', 'finish_workers'),
+                                          map(int, arguments.pipeline.split(','))))
+    ## With the findings in the standard output the messages go to stderr
+    messages = sys.stdout
+    if arguments.jsonl == '-':
+        batch_checker.jsonl_output = sys.stdout
+        messages = sys.stderr
+    elif arguments.jsonl:
+        batch_checker.jsonl_output = open(arguments.jsonl, 'w', encoding='utf-8')
+    if arguments.serve is not None:
+        host, _, port = arguments.serve.rpartition(':')
+        service = CheckerService(host or '127.0.0.1', int(port), arguments.workers,
+                                 arguments.queue_size, batch_checker.worker_options())
+        print('Сервис проверки запущен на http://{}:{}'.format(*service.server.server_address))
+        service.serve_forever()
+        return
+    try:
+        report = batch_checker.check(arguments.paths,
+                                     on_result=functools.partial(_print_batch_result,
+                                                                 output=messages))
+    finally:
+        if arguments.jsonl and arguments.jsonl != '-':
+            batch_checker.jsonl_output.close()
+    print('Проверено файлов: {} (с ошибками: {}) за {:.2f} с, {:.2f} презентаций/с'.format(
+        report['files_count'], report['failed_count'], report['seconds'],
+        report['decks_per_second']), file=messages)
+    if arguments.report:
+        with open(arguments.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    METRICS.save(arguments.metrics_json, arguments.metrics_prom)
+    
+    
 if __name__ == '__main__':
-    root = PptxCheckerRoot()
+    main()
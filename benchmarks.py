@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for PptxChecker.
+
+Every benchmark prints its results as JSON, so the output of two versions
+can be compared. Usage:
+    python benchmarks.py spelling --latency 0.05 --batches 20
+    python benchmarks.py typography --typography-lengths 100000 400000
+    python benchmarks.py pipeline --slides 50 --shapes 4 --media-size 50000000
+    python benchmarks.py typography_batch --small-shapes 10000 --error-density 0.05
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import re
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import PptxChecker
+
+
+class LocalSpellerServer:
+    '''
+    Local stand-in for YandexSpeller checkTexts. Answers with the same JSON
+    structure, marks the words from MISSPELLINGS as errors.
+    latency is added to every response, each fail_every-th request
+    is answered with 503 (0 - never)
+    '''
+
+    MISSPELLINGS = {'превет': ['привет'], 'ашибка': ['ошибка'],
+                    'собаке': ['собака', 'собаки'], 'teh': ['the']}
+    WORD_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, latency=0.0, fail_every=0):
+        self.latency = latency
+        self.fail_every = fail_every
+        self.requests_count = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0),
+                                            self.__make_handler())
+        self.__server.daemon_threads = True
+        self.__thread = None
+
+    @property
+    def url(self):
+        host, port = self.__server.server_address
+        return 'http://{}:{}/checkTexts'.format(host, port)
+
+    def check_text(self, text):
+        problems = []
+        for match in self.WORD_PATTERN.finditer(text):
+            word = match.group()
+            if word.lower() in self.MISSPELLINGS:
+                problems.append({'code': 1, 'pos': match.start(), 'row': 0,
+                                 'col': match.start(), 'len': len(word),
+                                 'word': word,
+                                 's': list(self.MISSPELLINGS[word.lower()])})
+        return problems
+
+    def __make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with server._lock:
+                    server.requests_count += 1
+                    server.bytes_received += len(body)
+                    request_number = server.requests_count
+                if server.latency:
+                    time.sleep(server.latency)
+                if server.fail_every and request_number % server.fail_every == 0:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                texts = parse_qs(body.decode('utf-8'),
+                                 keep_blank_values=True).get('text', [])
+                answer = json.dumps([server.check_text(text)
+                                     for text in texts]).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         daemon=True)
+        self.__thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class SyntheticDeck:
+    '''
+    Generates a .pptx deck with python-pptx: slides with text boxes of
+    the given length, a part of the words is replaced with spelling
+    and typography errors (error_density), one picture of about
+    media_size bytes (random, so it is not compressed) is added
+    to the first slide
+    '''
+    
+    WORDS = ('презентация', 'слайд', 'текст', 'проверка', 'данные', 'отчёт',
+             'результат', 'год', 'план', 'рост', 'the', 'report', 'and')
+    ERRORS = ('превет', 'ашибка', 'teh', '-', '"цитата"', '10-20', '«вложенные "кавычки"»')
+    
+    def __init__(self, slides=20, shapes=4, text_length=500, error_density=0.05,
+                 media_size=0, seed=0):
+        self.slides = slides
+        self.shapes = shapes
+        self.text_length = text_length
+        self.error_density = error_density
+        self.media_size = media_size
+        self.random = random.Random(seed)
+        
+    def text(self):
+        words = []
+        length = 0
+        while length < self.text_length:
+            if self.random.random() < self.error_density:
+                word = self.random.choice(self.ERRORS)
+            else:
+                word = self.random.choice(self.WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words).capitalize() + '.'
+    
+    def png(self):
+        '''
+        RGB PNG with random pixels of about media_size bytes
+        '''
+        def chunk(kind, data):
+            return (struct.pack('>I', len(data)) + kind + data +
+                    struct.pack('>I', zlib.crc32(kind + data)))
+        side = max(1, int((self.media_size / 3) ** 0.5))
+        rows = b''.join(b'\x00' + self.random.randbytes(side * 3) for i in range(side))
+        return (b'\x89PNG\r\n\x1a\n' +
+                chunk(b'IHDR', struct.pack('>IIBBBBB', side, side, 8, 2, 0, 0, 0)) +
+                chunk(b'IDAT', zlib.compress(rows, 1)) + chunk(b'IEND', b''))
+    
+    def save(self, path):
+        from pptx import Presentation
+        from pptx.util import Inches
+        presentation = Presentation()
+        blank_layout = presentation.slide_layouts[6]
+        for slide_id in range(self.slides):
+            slide = presentation.slides.add_slide(blank_layout)
+            for shape_id in range(self.shapes):
+                text_box = slide.shapes.add_textbox(Inches(0.5), Inches(0.5 + shape_id * 1.5),
+                                                    Inches(9), Inches(1.4))
+                text_box.text_frame.text = self.text()
+            if slide_id == 0 and self.media_size:
+                slide.shapes.add_picture(io.BytesIO(self.png()), Inches(8), Inches(6),
+                                         Inches(1), Inches(1))
+        presentation.save(path)
+        return path
+
+
+def _timed(timings, stage, function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def bench_pipeline(arguments):
+    '''
+    Generates a synthetic deck and times each stage of checking
+    and correcting it separately
+    '''
+    deck = SyntheticDeck(arguments.slides, arguments.shapes, arguments.text_length,
+                         arguments.error_density, arguments.media_size)
+    directory = tempfile.mkdtemp()
+    try:
+        path = arguments.deck or os.path.join(directory, 'deck.pptx')
+        timings = {}
+        _timed(timings, 'generate', deck.save, path)
+        deck_bytes = os.path.getsize(path)
+        checker = _timed(timings, 'load', PptxChecker.PptxChecker, path)
+        ## The streaming checker reads the texts when they are taken
+        _timed(timings, 'load_streaming',
+               lambda: PptxChecker.StreamingPptxChecker(path, True).texts_to_checker())
+        texts = checker.texts_to_checker()
+        typography_problems = _timed(timings, 'typography',
+                                     PptxChecker.TypographyChecker()._check_texts, texts)
+        with LocalSpellerServer(arguments.latency) as server:
+            client = PptxChecker.SpellerClient(server.url, arguments.max_in_flight)
+            spelling_problems = _timed(timings, 'spelling',
+                                       PptxChecker.SpellChecker(client)._check_texts, texts)
+            client.close()
+        texts_problems = []
+        for problems in zip(spelling_problems, typography_problems):
+            problems = sorted(problems[0] + problems[1], key=lambda x: x['pos'])
+            for problem in problems:
+                problem['choice'] = 0
+            texts_problems.append(problems)
+        checker.set_texts_problems(texts_problems)
+        _timed(timings, 'correct', checker._correct_content)
+        _timed(timings, 'save_fast', checker._save_content,
+               os.path.join(directory, 'fast.pptx'))
+        checker.fast_save = False
+        _timed(timings, 'save_full', checker._save_content,
+               os.path.join(directory, 'full.pptx'))
+    finally:
+        shutil.rmtree(directory)
+    return {'deck': {'slides': arguments.slides, 'shapes': arguments.shapes,
+                     'text_length': arguments.text_length,
+                     'error_density': arguments.error_density,
+                     'media_size': arguments.media_size,
+                     'bytes': deck_bytes},
+            'texts': len(texts), 'chars': sum(len(text) for text in texts),
+            'problems': sum(len(problems) for problems in texts_problems),
+            'requests': server.requests_count,
+            'seconds': timings}
+
+
+def bench_local_speller(arguments):
+    '''
+    Builds a LocalSpeller index of a synthetic dictionary and checks
+    a text of --local-words words (every 20th one misspelled)
+    '''
+    generator = random.Random(0)
+    letters = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+    dictionary = sorted({''.join(generator.choice(letters)
+                                 for i in range(generator.randint(3, 12)))
+                         for j in range(arguments.dictionary_size)})
+    directory = tempfile.mkdtemp()
+    try:
+        dictionary_path = os.path.join(directory, 'dictionary.txt')
+        index_path = os.path.join(directory, 'dictionary.index')
+        with open(dictionary_path, 'w', encoding='utf-8') as f:
+            f.writelines('{} {}\n'.format(word, generator.randint(1, 10**6))
+                         for word in dictionary)
+        timings = {}
+        _timed(timings, 'build', PptxChecker.LocalSpeller.build_index,
+               [dictionary_path], index_path)
+        speller = _timed(timings, 'load', PptxChecker.LocalSpeller, index_path)
+        ## Zipf-like text: frequent words repeat
+        vocabulary = dictionary[:5000]
+        words = [generator.choice(vocabulary[:generator.randint(1, len(vocabulary))])
+                 for i in range(arguments.local_words)]
+        for i in range(0, len(words), 20):
+            words[i] = words[i][::-1] + 'ъ'
+        text = ' '.join(words)
+        texts = [text[i:i + 5000] for i in range(0, len(text), 5000)]
+        problems = _timed(timings, 'check', speller.check_batches, [texts])
+        speller.close()
+        index_bytes = os.path.getsize(index_path)
+    finally:
+        shutil.rmtree(directory)
+    return {'dictionary_words': len(dictionary), 'index_bytes': index_bytes,
+            'text_words': len(words),
+            'problems': sum(len(text_problems) for text_problems in problems),
+            'seconds': timings,
+            'words_per_minute': len(words) / timings['check'] * 60}
+
+
+def _sample_texts(count, length):
+    sentence = 'Превет, это ашибка в тексте - и ещё одна строка текста. '
+    text = (sentence * (length // len(sentence) + 1))[:length]
+    return [text for i in range(count)]
+
+
+def bench_spelling(arguments):
+    '''
+    Compares sequential and concurrent checking of the same batches
+    '''
+    texts = _sample_texts(arguments.batches * arguments.texts_per_batch,
+                          arguments.text_length)
+    batches = [texts[i:i + arguments.texts_per_batch]
+               for i in range(0, len(texts), arguments.texts_per_batch)]
+    results = {'batches': len(batches), 'latency': arguments.latency,
+               'fail_every': arguments.fail_every}
+    reference = None
+    for in_flight in (1, arguments.max_in_flight):
+        with LocalSpellerServer(arguments.latency, arguments.fail_every) as server:
+            client = PptxChecker.SpellerClient(server.url, max_in_flight=in_flight,
+                                               backoff_base=0.01)
+            start = time.perf_counter()
+            problems = client.check_batches(batches)
+            elapsed = time.perf_counter() - start
+            client.close()
+        if reference is None:
+            reference = problems
+        results['in_flight_' + str(in_flight)] = {
+            'seconds': elapsed, 'requests': server.requests_count,
+            'same_output': problems == reference}
+    return results
+
+
+def bench_typography(arguments):
+    '''
+    Checks texts of growing length with TypographyChecker.
+    For a linear scan the time per 1000 characters stays the same
+    '''
+    sentence = 'Цены выросли на 10-15% - «так „говорят“ в "отчёте"». '
+    checker = PptxChecker.TypographyChecker()
+    results = {}
+    for length in arguments.typography_lengths:
+        text = (sentence * (length // len(sentence) + 1))[:length]
+        start = time.perf_counter()
+        problems = checker._check_texts([text])[0]
+        elapsed = time.perf_counter() - start
+        results[str(length)] = {'seconds': elapsed,
+                                'seconds_per_1000_chars': elapsed * 1000 / length,
+                                'problems': len(problems)}
+    return results
+
+
+def bench_typography_batch(arguments):
+    '''
+    Checks the texts of decks with many small shapes (labels, table cells)
+    with TypographyChecker one by one and joined into one buffer.
+    The problems must be the same
+    '''
+    labels = ['Итог', 'Выручка', 'Q3', '2020', 'Цена, ₽', 'Отдел продаж', '12%', '',
+              'План', 'Факт', '«Да»', 'Москва', 'Доля рынка', '1 250', 'Всего']
+    wrong_labels = ['10-15', '"Да"', 'Q3 - план', '2019—2020']
+    random.seed(0)
+    results = {}
+    for shapes in arguments.small_shapes:
+        texts = [random.choice(wrong_labels if random.random() < arguments.error_density
+                               else labels) for i in range(shapes)]
+        run = {}
+        for mode, checker in (('per_text', PptxChecker.TypographyChecker(batched=False)),
+                              ('batched', PptxChecker.TypographyChecker())):
+            start = time.perf_counter()
+            problems = checker._check_texts(texts)
+            elapsed = time.perf_counter() - start
+            run[mode] = {'seconds': elapsed, 'texts_per_second': shapes / elapsed,
+                         'problems': [[dict(problem) for problem in text_problems]
+                                      for text_problems in problems]}
+        results[str(shapes)] = {'per_text_seconds': run['per_text']['seconds'],
+                                'batched_seconds': run['batched']['seconds'],
+                                'batched_texts_per_second': run['batched']['texts_per_second'],
+                                'speedup': run['per_text']['seconds'] / run['batched']['seconds'],
+                                'same_problems': run['per_text']['problems'] ==
+                                                 run['batched']['problems']}
+    return results
+
+
+def bench_context(arguments):
+    '''
+    Finds the problems and their context (text_to_show) in one text block
+    with many problems. The block is split into sentences once, so the time
+    per problem should not grow with the number of problems
+    '''
+    sentence = 'Это - предложение с дефисом между пробелами. '
+    checker = PptxChecker.TypographyChecker()
+    results = {}
+    for count in arguments.context_problems:
+        text = sentence * count
+        start = time.perf_counter()
+        problems = checker.find_problems([text])[0]
+        elapsed = time.perf_counter() - start
+        results[str(count)] = {'seconds': elapsed, 'problems': len(problems),
+                               'seconds_per_problem': elapsed / len(problems)}
+    return results
+
+
+STARTUP_COMMANDS = {
+    'import': 'import PptxChecker',
+    'cli_help': 'import PptxChecker, contextlib, io\n'
+                'with contextlib.redirect_stdout(io.StringIO()):\n'
+                '    try:\n'
+                '        PptxChecker.main(["--help"])\n'
+                '    except SystemExit:\n'
+                '        pass',
+    'typography': 'import PptxChecker\n'
+                  'PptxChecker.TypographyChecker()._check_texts(["1-2 - «x»"])'}
+HEAVY_MODULES = ('tkinter', 'pptx', 'nltk', 'requests')
+
+
+def bench_startup(arguments):
+    '''
+    Starts new interpreters running the headless paths and measures
+    the wall time. Also reports which heavy modules were imported
+    '''
+    results = {}
+    for name, command in STARTUP_COMMANDS.items():
+        check = (command + '\nimport sys\nprint(",".join(m for m in {!r} '
+                 'if m in sys.modules))').format(HEAVY_MODULES)
+        times = []
+        for i in range(arguments.startup_runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', check], check=True,
+                                    capture_output=True, text=True,
+                                    cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+            times.append(time.perf_counter() - start)
+        results[name] = {'best_seconds': min(times),
+                         'mean_seconds': sum(times) / len(times),
+                         'heavy_modules': [module for module in output.strip().split(',')
+                                           if module]}
+    return results
+
+
+BENCHMARKS = {'spelling': bench_spelling, 'typography': bench_typography,
+              'context': bench_context, 'startup': bench_startup,
+              'pipeline': bench_pipeline, 'local_speller': bench_local_speller,
+              'typography_batch': bench_typography_batch}
+
+
+def _parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description='PptxChecker benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS) + ['all'])
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='latency of the local speller, seconds')
+    parser.add_argument('--fail-every', type=int, default=0,
+                        help='every n-th speller request fails with 503')
+    parser.add_argument('--batches', type=int, default=20)
+    parser.add_argument('--texts-per-batch', type=int, default=10)
+    parser.add_argument('--text-length', type=int, default=500)
+    parser.add_argument('--max-in-flight', type=int, default=8)
+    parser.add_argument('--typography-lengths', type=int, nargs='+',
+                        default=[10000, 100000, 200000, 400000])
+    parser.add_argument('--small-shapes', type=int, nargs='+',
+                        default=[1000, 10000, 100000],
+                        help='number of small texts for typography_batch')
+    parser.add_argument('--context-problems', type=int, nargs='+',
+                        default=[100, 500, 2000])
+    parser.add_argument('--startup-runs', type=int, default=5)
+    parser.add_argument('--slides', type=int, default=20)
+    parser.add_argument('--shapes', type=int, default=4,
+                        help='text boxes per slide')
+    parser.add_argument('--error-density', type=float, default=0.05,
+                        help='part of the words replaced with errors')
+    parser.add_argument('--media-size', type=int, default=0,
+                        help='size of the picture in the deck, bytes')
+    parser.add_argument('--dictionary-size', type=int, default=100000)
+    parser.add_argument('--local-words', type=int, default=1000000)
+    parser.add_argument('--deck', default=None,
+                        help='where to save the generated deck (temporary by default)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = _parse_arguments(argv)
+    names = sorted(BENCHMARKS) if arguments.benchmark == 'all' else [arguments.benchmark]
+    print(json.dumps({name: BENCHMARKS[name](arguments) for name in names},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+'''
+Small .pptx packages and fake checked files for the tests
+'''
+import random
+import threading
+import time
+import zipfile
+from xml.sax.saxutils import escape
+
+from PptxChecker import Problem
+
+P = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+A = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+R = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PR = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+
+def _shape(shape_id, text):
+    '''
+    A p:sp with the text (paragraphs split by '\\n'), without txBody if text is None
+    '''
+    body = ''
+    if text is not None:
+        body = '<p:txBody>{}</p:txBody>'.format(''.join(
+            '<a:p><a:r><a:t>{}</a:t></a:r></a:p>'.format(escape(paragraph))
+            for paragraph in text.split('\n')))
+    return ('<p:sp><p:nvSpPr><p:cNvPr id="{}" name="t"/><p:cNvSpPr/><p:nvPr/></p:nvSpPr>'
+            '<p:spPr/>{}</p:sp>').format(shape_id, body)
+
+
+def make_deck(path, slides):
+    '''
+    Writes a minimal .pptx package for PptxXmlReader: slides is a list
+    of lists of texts (None - a shape without a text body)
+    '''
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as deck:
+        ids = ''.join('<p:sldId id="{}" r:id="rId{}"/>'.format(256 + i, i + 1)
+                      for i in range(len(slides)))
+        deck.writestr('ppt/presentation.xml',
+                      '<p:presentation xmlns:p="{}" xmlns:r="{}"><p:sldIdLst>{}'
+                      '</p:sldIdLst></p:presentation>'.format(P, R, ids))
+        rels = ''.join('<Relationship Id="rId{0}" Type="{1}/slide" '
+                       'Target="slides/slide{0}.xml"/>'.format(i + 1, R)
+                       for i in range(len(slides)))
+        deck.writestr('ppt/_rels/presentation.xml.rels',
+                      '<Relationships xmlns="{}">{}</Relationships>'.format(PR, rels))
+        for i, texts in enumerate(slides):
+            shapes = ''.join(_shape(shape_id, text) for shape_id, text in enumerate(texts, 2))
+            deck.writestr('ppt/slides/slide{}.xml'.format(i + 1),
+                          '<p:sld xmlns:p="{}" xmlns:a="{}"><p:cSld><p:spTree>{}'
+                          '</p:spTree></p:cSld></p:sld>'.format(P, A, shapes))
+    return path
+
+
+class FakeFile:
+    '''
+    A checked file with the given texts, its problems are kept in problems
+    '''
+    manifest = None
+    
+    def __init__(self, texts):
+        self.texts = texts
+        self.problems = None
+        
+    def texts_to_checker(self):
+        return list(self.texts)
+    
+    def iter_texts_to_checker(self):
+        return iter(self.texts)
+    
+    def set_texts_problems(self, texts_problems):
+        self.problems = texts_problems
+
+
+class FakeSpeller:
+    '''
+    Finds the word "ошибка" and remembers the checked texts. With max_delay
+    it answers after a random delay, so the checks overtake each other
+    '''
+    def __init__(self, max_delay=0):
+        self.max_delay = max_delay
+        self.checked = []
+        self.__lock = threading.Lock()
+        
+    def find_problems(self, texts):
+        if self.max_delay:
+            time.sleep(random.uniform(0, self.max_delay))
+        with self.__lock:
+            self.checked += texts
+        return [[Problem(text.find('ошибка'), 6, ['ошибка'], 'spelling', 'ошибка')]
+                if 'ошибка' in text else [] for text in texts]
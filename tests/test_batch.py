@@ -0,0 +1,19 @@
+import io
+import json
+
+from PptxChecker import BatchChecker, TYPOGRAPHY_ASPECT
+
+from decks import make_deck
+
+
+def test_findings_use_the_text_index_and_the_slide_of_the_location(tmp_path):
+    deck = make_deck(str(tmp_path / 'deck.pptx'), [['Без ошибок'], ['Первый', 'Второй - "текст"']])
+    output = io.StringIO()
+    checker = BatchChecker([TYPOGRAPHY_ASPECT], streaming=True, pipeline={}, jsonl_output=output)
+    checker.check([deck])
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert records
+    for record in records:
+        assert (record['slide'], record['text']) == (1, 2)
+        assert record['location'] == {'slide': 1, 'kind': 'shape', 'shape_id': 3}
+        assert 'shape' not in record
@@ -0,0 +1,58 @@
+import pytest
+
+from PptxChecker import (AspectCheckerManager, CheckManifest, TypographyChecker,
+                         SPELLING_ASPECT, TYPOGRAPHY_ASPECT)
+
+from decks import FakeFile, FakeSpeller
+
+ASPECTS = [SPELLING_ASPECT, TYPOGRAPHY_ASPECT]
+TEXTS = ['Текст "{}" - ошибка'.format(i % 4) if i % 3 else 'Текст {} без ошибок'.format(i % 2)
+         for i in range(23)]
+
+
+def _problems(texts_problems):
+    return [sorted((problem['pos'], problem['len'], problem['type']) for problem in problems)
+            for problems in texts_problems]
+
+
+def _manager():
+    return AspectCheckerManager(FakeSpeller(), TypographyChecker())
+
+
+@pytest.fixture
+def expected():
+    file_to_check = FakeFile(TEXTS)
+    _manager().set_problems(file_to_check, ASPECTS)
+    return _problems(file_to_check.problems)
+
+
+def test_iter_problems_is_the_same_as_set_problems(expected):
+    assert _problems(_manager().iter_problems(iter(TEXTS), ASPECTS, chunk_size=5)) == expected
+
+
+@pytest.mark.parametrize('use_manifest', [False, True])
+def test_chunks_are_the_same_as_set_problems(tmp_path, expected, use_manifest):
+    manifest = CheckManifest(str(tmp_path / 'deck.check.json')) if use_manifest else None
+    manager = _manager()
+    file_to_check = FakeFile(TEXTS)
+    chunks = []
+    assert manager.set_problems_by_chunks(file_to_check, ASPECTS, manifest,
+                                          on_chunk=lambda start, problems: chunks.append(start),
+                                          chunk_size=5)
+    assert chunks == [0, 5, 10, 15, 20]
+    assert _problems(file_to_check.problems) == expected
+    ## The texts repeated in the later chunks are not checked again
+    assert sorted(manager.spell_checker.checked) == sorted(set(TEXTS))
+
+
+def test_manifest_problems_are_reused_by_chunks(tmp_path, expected):
+    manifest = CheckManifest(str(tmp_path / 'deck.check.json'))
+    _manager().set_problems_by_chunks(FakeFile(TEXTS), ASPECTS, manifest, chunk_size=5)
+    manifest.save()
+    manager = _manager()
+    file_to_check = FakeFile(TEXTS)
+    manager.set_problems_by_chunks(file_to_check, ASPECTS,
+                                   CheckManifest(str(tmp_path / 'deck.check.json')),
+                                   chunk_size=7)
+    assert manager.spell_checker.checked == []
+    assert _problems(file_to_check.problems) == expected
@@ -0,0 +1,47 @@
+import zipfile
+
+import pytest
+
+import PptxChecker
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'source.zip'
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('ppt/slides/slide1.xml', '<a>старый текст</a>' * 100,
+                         zipfile.ZIP_DEFLATED)
+        archive.writestr('ppt/media/image1.png', bytes(range(256)) * 50, zipfile.ZIP_STORED)
+        archive.writestr('docProps/app.xml', '<app/>' * 50, zipfile.ZIP_DEFLATED)
+    return path
+
+
+def _raw_entries(path):
+    with zipfile.ZipFile(path) as archive:
+        return {info.filename: (info.compress_type, info.compress_size, info.CRC)
+                for info in archive.infolist()}
+
+
+def test_replaced_parts_are_written_the_rest_is_copied_raw(source, tmp_path):
+    target = tmp_path / 'target.zip'
+    PptxChecker.copy_zip_with_replaced_parts(str(source), str(target),
+                                             {'ppt/slides/slide1.xml': b'<a>new</a>'})
+    with zipfile.ZipFile(target) as archive, zipfile.ZipFile(source) as original:
+        assert archive.testzip() is None
+        assert archive.namelist() == original.namelist()
+        assert archive.read('ppt/slides/slide1.xml') == b'<a>new</a>'
+        for name in ('ppt/media/image1.png', 'docProps/app.xml'):
+            assert archive.read(name) == original.read(name)
+    source_entries, target_entries = _raw_entries(source), _raw_entries(target)
+    del source_entries['ppt/slides/slide1.xml'], target_entries['ppt/slides/slide1.xml']
+    assert target_entries == source_entries
+
+
+def test_entries_are_recompressed_without_zipfile_internals(source, tmp_path, monkeypatch):
+    monkeypatch.setattr(PptxChecker, 'ZIP_INTERNALS', ('fp', 'no_such_attribute'))
+    target = tmp_path / 'target.zip'
+    PptxChecker.copy_zip_with_replaced_parts(str(source), str(target), {})
+    with zipfile.ZipFile(target) as archive, zipfile.ZipFile(source) as original:
+        assert archive.testzip() is None
+        for name in original.namelist():
+            assert archive.read(name) == original.read(name)
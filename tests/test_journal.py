@@ -0,0 +1,112 @@
+import pytest
+
+from PptxChecker import (AspectCheckerManager, BatchChecker, BatchJournal, StreamingPptxChecker,
+                         TypographyChecker, TYPOGRAPHY_ASPECT)
+
+from decks import make_deck
+
+TEXTS = ['Текст {} - с "кавычками"'.format(i) if i % 2 else 'Текст {}'.format(i)
+         for i in range(150)]
+## The texts of the first deck in the order of reading ('' - the shape without a text body)
+FIRST_TEXTS = TEXTS[:70] + [''] + TEXTS[70:]
+CHUNK_SIZE = AspectCheckerManager.STREAM_CHUNK_SIZE
+
+
+@pytest.fixture
+def checked_texts(monkeypatch):
+    '''
+    The texts given to the typography checker
+    '''
+    checked = []
+    check_texts = TypographyChecker._check_texts
+    
+    def counting_check_texts(self, texts):
+        checked.extend(texts)
+        return check_texts(self, texts)
+    monkeypatch.setattr(TypographyChecker, '_check_texts', counting_check_texts)
+    return checked
+
+
+@pytest.fixture
+def decks(tmp_path):
+    return [make_deck(str(tmp_path / 'first.pptx'), [TEXTS[:70], [None] + TEXTS[70:]]),
+            make_deck(str(tmp_path / 'second.pptx'), [['Второй - файл']])]
+
+
+def _check(journal_path, decks):
+    checker = BatchChecker([TYPOGRAPHY_ASPECT], streaming=True, pipeline={},
+                           journal_path=str(journal_path))
+    return checker.check(decks)['files']
+
+
+def _problems(result):
+    return [(problem['slide'], problem['text'], problem['pos'], problem['type'])
+            for problem in result['problems']]
+
+
+def _fail_on(monkeypatch, failing_text):
+    check_texts = TypographyChecker._check_texts
+    
+    def failing_check_texts(self, texts):
+        if failing_text in texts:
+            raise RuntimeError('сбой')
+        return check_texts(self, texts)
+    monkeypatch.setattr(TypographyChecker, '_check_texts', failing_check_texts)
+
+
+def test_finished_files_are_resumed(tmp_path, decks, checked_texts):
+    first = _check(tmp_path / 'job.sqlite', decks)
+    assert [result['error'] for result in first] == [None, None]
+    assert [result.get('resumed') for result in first] == [None, None]
+    assert set(checked_texts) >= set(TEXTS)
+    del checked_texts[:]
+    second = _check(tmp_path / 'job.sqlite', decks)
+    assert checked_texts == []
+    assert [result['resumed'] for result in second] == [True, True]
+    assert [_problems(result) for result in second] == [_problems(result) for result in first]
+    assert _problems(second[0])
+
+
+def test_checked_chunks_of_a_failed_file_are_not_checked_again(tmp_path, decks, checked_texts):
+    expected = _check(tmp_path / 'clean.sqlite', decks)
+    with pytest.MonkeyPatch.context() as patch:
+        _fail_on(patch, FIRST_TEXTS[2 * CHUNK_SIZE + 5])
+        failed = _check(tmp_path / 'job.sqlite', decks)
+    assert failed[0]['error'].startswith('RuntimeError') and failed[1]['error'] is None
+    del checked_texts[:]
+    resumed = _check(tmp_path / 'job.sqlite', decks)
+    ## Only the failed chunk is checked again
+    assert sorted(checked_texts) == sorted(FIRST_TEXTS[2 * CHUNK_SIZE:])
+    assert [result.get('resumed') for result in resumed] == [None, True]
+    assert _problems(resumed[0]) == _problems(expected[0])
+
+
+def test_chunks_saved_before_a_crash_are_reused(tmp_path, decks, checked_texts):
+    journal = BatchJournal(str(tmp_path / 'job.sqlite'))
+    manager = AspectCheckerManager(typography_checker=TypographyChecker())
+    
+    def check(crash_at=None):
+        file_to_check = StreamingPptxChecker(decks[0])
+        journal_texts = journal.texts(manager.config_key())
+        
+        def on_chunk(start, problems):
+            journal_texts.save()
+            if start == crash_at:
+                raise RuntimeError('сбой')
+        manager.set_problems_by_chunks(file_to_check, [TYPOGRAPHY_ASPECT], journal_texts,
+                                       on_chunk, chunk_size=50)
+        return [[(problem['pos'], problem['type']) for problem in problems[0]]
+                for problems in file_to_check.problems_to_show()]
+    
+    try:
+        with pytest.raises(RuntimeError):
+            check(crash_at=50)
+        del checked_texts[:]
+        resumed = check()
+        assert sorted(checked_texts) == sorted(FIRST_TEXTS[100:])
+    finally:
+        journal.close()
+    expected = StreamingPptxChecker(decks[0])
+    manager.set_problems(expected, [TYPOGRAPHY_ASPECT])
+    assert resumed == [[(problem['pos'], problem['type']) for problem in problems[0]]
+                       for problems in expected.problems_to_show()]
@@ -0,0 +1,25 @@
+import pytest
+
+from PptxChecker import LocalSpeller
+
+
+@pytest.fixture
+def speller(tmp_path):
+    dictionary = tmp_path / 'words.txt'
+    dictionary.write_text('ёлка 10\nелей 3\nзелёный 5\nлес 7\n', encoding='utf-8')
+    index_path = str(tmp_path / 'words.index')
+    LocalSpeller.build_index([str(dictionary)], index_path)
+    speller = LocalSpeller(index_path)
+    yield speller
+    speller.close()
+
+
+@pytest.mark.parametrize('text', ['ёлка', 'елка', 'Елка', 'зеленый', 'зелёный', 'елей', 'ёлей'])
+def test_both_spellings_of_yo_are_known(speller, text):
+    assert speller.check_text(text) == []
+
+
+def test_suggestions_keep_the_dictionary_spelling(speller):
+    assert [problem['s'] for problem in speller.check_text('Елкка')] == [['Ёлка']]
+    assert [problem['s'] for problem in speller.check_text('лесс зеленвй')] == \
+        [['лес'], ['зелёный']]
@@ -0,0 +1,43 @@
+import pytest
+
+import PptxChecker
+from PptxChecker import CheckManifest, Problem, ProtectedKeyException, SPELLING_ASPECT
+
+
+def _saved_manifest(tmp_path, config_key):
+    manifest = CheckManifest(str(tmp_path / 'deck.check.json'), config_key)
+    problem = Problem(0, 5, ['Привет'], 'spelling', 'Превет')
+    problem['choice'] = 0
+    manifest.record('Превет', [SPELLING_ASPECT], [problem])
+    manifest.save()
+    return manifest.path
+
+
+def test_saved_choice_can_be_changed_in_the_review(tmp_path):
+    path = _saved_manifest(tmp_path, 'config')
+    problem, = CheckManifest(path, 'config').lookup('Превет', [SPELLING_ASPECT])
+    assert problem['choice'] == 0
+    with pytest.raises(ProtectedKeyException):
+        problem['choice'] = 1
+    problem.review(1)
+    assert problem['choice'] == 1
+
+
+def test_problems_of_other_checkers_are_not_reused(tmp_path):
+    path = _saved_manifest(tmp_path, 'config')
+    assert CheckManifest(path, 'config').lookup('Превет', [SPELLING_ASPECT]) is not None
+    assert CheckManifest(path, 'other').lookup('Превет', [SPELLING_ASPECT]) is None
+
+
+def test_config_key_depends_on_the_speller_options(tmp_path):
+    def config_key(lang='ru', **prefilter_options):
+        client = PptxChecker.SpellerClient('http://localhost/checkTexts', lang=lang)
+        spell_checker = PptxChecker.SpellChecker(client,
+                                                 prefilter=PptxChecker.SpellPrefilter(
+                                                     **prefilter_options))
+        return PptxChecker.AspectCheckerManager(spell_checker).config_key()
+    
+    assert config_key() == config_key()
+    assert config_key() != config_key(user_words=['ПпТх'])
+    assert config_key() != config_key(skip_patterns=())
+    assert config_key() != config_key(lang='ru,en')
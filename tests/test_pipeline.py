@@ -0,0 +1,117 @@
+import threading
+import time
+
+import pytest
+
+from PptxChecker import (AspectCheckerManager, PipelinedCheckerManager, TypographyChecker,
+                         SPELLING_ASPECT, TYPOGRAPHY_ASPECT)
+
+from decks import FakeFile, FakeSpeller
+
+ASPECTS = [SPELLING_ASPECT, TYPOGRAPHY_ASPECT]
+
+
+## The checks of the files overtake each other
+DELAY = 0.01
+
+
+def _files(count):
+    return [['Файл {} - текст "{}"'.format(i, j) + (' ошибка' if (i + j) % 3 == 0 else '')
+             for j in range(i % 5)] for i in range(count)]
+
+
+def _problems(file_to_check):
+    return [[(problem['pos'], problem['type']) for problem in problems]
+            for problems in file_to_check.problems]
+
+
+def _pipeline_threads():
+    return [thread for thread in threading.enumerate() if thread is not threading.current_thread()
+            and thread.daemon]
+
+
+@pytest.mark.parametrize('chunk_size', [None, 2])
+def test_each_file_gets_its_own_problems(chunk_size):
+    files = _files(40)
+    manager = PipelinedCheckerManager(FakeSpeller(DELAY), TypographyChecker(), extract_workers=2,
+                                      typography_workers=2, spelling_workers=3,
+                                      finish_workers=2, queue_size=2, chunk_size=chunk_size)
+    outputs = list(manager.run(files, FakeFile, ASPECTS, lambda item, file_to_check: file_to_check))
+    assert sorted(index for index, item, result, error in outputs) == list(range(40))
+    sequential = AspectCheckerManager(FakeSpeller(DELAY), TypographyChecker())
+    for index, item, result, error in outputs:
+        assert error is None and item is files[index]
+        expected = FakeFile(item)
+        sequential.set_problems(expected, ASPECTS)
+        assert _problems(result) == _problems(expected)
+
+
+@pytest.mark.parametrize('chunk_size', [None, 1])
+def test_errors_are_reported_and_the_stages_stop(chunk_size):
+    before = len(_pipeline_threads())
+    
+    def load(item):
+        if item == 'bad':
+            raise ValueError('не открывается')
+        return FakeFile(item)
+    
+    def finish(item, file_to_check):
+        if item == ['последний']:
+            raise RuntimeError('не сохраняется')
+        return len(file_to_check.problems)
+    
+    items = [['первый'], 'bad', ['второй - текст', 'ошибка'], ['последний']]
+    manager = PipelinedCheckerManager(FakeSpeller(DELAY), TypographyChecker(),
+                                      chunk_size=chunk_size)
+    outputs = {index: (result, error) for index, item, result, error
+               in manager.run(items, load, ASPECTS, finish)}
+    assert outputs[0] == (1, None) and outputs[2] == (2, None)
+    assert isinstance(outputs[1][1], ValueError)
+    assert isinstance(outputs[3][1], RuntimeError)
+    for attempt in range(100):
+        if len(_pipeline_threads()) <= before:
+            break
+        time.sleep(0.01)
+    assert len(_pipeline_threads()) <= before
+
+
+def test_every_stage_needs_a_thread():
+    with pytest.raises(ValueError):
+        PipelinedCheckerManager(FakeSpeller(DELAY), spelling_workers=0)
+
+
+class SavedManifest:
+    '''
+    Keeps the recorded texts, save makes a snapshot of them
+    '''
+    def __init__(self):
+        self.recorded = []
+        self.saved = []
+        
+    def lookup_many(self, texts, chosen_aspects):
+        return [None] * len(texts)
+    
+    def record(self, text, chosen_aspects, problems):
+        self.recorded.append(text)
+        
+    def save(self):
+        self.saved.append(len(self.recorded))
+
+
+def test_chunks_are_saved_as_they_are_merged():
+    texts = ['Текст {}'.format(i) for i in range(7)]
+    file_to_check = FakeFile(texts)
+    file_to_check.manifest = SavedManifest()
+    manager = PipelinedCheckerManager(FakeSpeller(DELAY), TypographyChecker(), chunk_size=3)
+    (index, item, result, error), = manager.run([texts], lambda item: file_to_check, ASPECTS)
+    assert error is None and len(file_to_check.problems) == 7
+    ## The chunks may be merged in any order, each one is saved
+    assert len(file_to_check.manifest.saved) == 3 and file_to_check.manifest.saved[-1] == 7
+    assert sorted(file_to_check.manifest.recorded) == texts
+
+
+def test_file_without_texts_is_finished_by_chunks():
+    manager = PipelinedCheckerManager(FakeSpeller(DELAY), TypographyChecker(), chunk_size=3)
+    (index, item, result, error), = manager.run([[]], FakeFile, ASPECTS,
+                                                lambda item, file_to_check: file_to_check)
+    assert error is None and result.problems == []
@@ -0,0 +1,63 @@
+import random
+import re
+import time
+
+import pytest
+
+from PptxChecker import SpellChecker, SpellPrefilter
+
+
+class WordsClient:
+    '''
+    Reports every word of the letters as a typo and records the sent texts
+    '''
+    def __init__(self):
+        self.sent = []
+        
+    def check_batches(self, batches):
+        texts = [text for batch in batches for text in batch]
+        self.sent += texts
+        return [[{'pos': match.start(), 'len': len(match.group()), 'word': match.group(),
+                  's': []} for match in re.finditer(r'[^\W\d_]+', text)] for text in texts]
+
+
+WORDS = ['слово', 'Проверка', 'https://example.com/a-b?x=1', 'www.site.ru',
+         'mail.box@example.org', '2020', 'A4', 'x86-64', 'ПпТх', '']
+SEPARATORS = [' ', ', ', '\n', ' (', ') ']
+
+
+def _random_texts(seed, count):
+    generator = random.Random(seed)
+    return [''.join(generator.choice(WORDS) + generator.choice(SEPARATORS)
+                    for i in range(generator.randrange(0, 8)))
+            for j in range(count)]
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_positions_are_moved_back_to_the_original_text(seed):
+    client = WordsClient()
+    texts = _random_texts(seed, 30)
+    found = SpellChecker(client, prefilter=SpellPrefilter(['пптх']))._check_texts(texts)
+    for text, problems in zip(texts, found):
+        expected = re.findall(r'\b(?:слово|Проверка)\b', text)
+        assert [problem['word'] for problem in problems] == expected
+        for problem in problems:
+            assert text[problem['pos']:problem['pos'] + problem['len']] == problem['word']
+    assert all(text.strip() for text in client.sent)
+    assert not any('@' in text or 'example' in text or re.search(r'\d', text)
+                   for text in client.sent)
+
+
+def test_mask_leaves_a_space_for_each_cut():
+    masked, shifts = SpellPrefilter().mask('см. https://a.ru/x и тел. 8-800 сейчас')
+    assert masked == 'см.   и тел.   сейчас'
+    assert shifts == ([5, 14], [13, 17])
+
+
+@pytest.mark.parametrize('text', ['x' * 9000, 'а-' * 4000, 'a.' * 4500 + '@', 'ab' * 4000 + '@x'])
+def test_long_tokens_are_masked_in_linear_time(text):
+    prefilter = SpellPrefilter()
+    start = time.perf_counter()
+    assert prefilter.mask(text) == (text, ([], []))
+    ## Quadratic matching took more than 0.5 s for these texts
+    assert time.perf_counter() - start < 0.1
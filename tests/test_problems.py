@@ -0,0 +1,64 @@
+import PptxChecker
+from PptxChecker import CheckManifest, TypographyChecker, TYPOGRAPHY_ASPECT
+
+LONG_TEXT = ('Первое предложение о ценах - довольно длинное, чтобы его разбить. '
+             'Второе предложение: цены 10-20 рублей, "много".')
+
+
+def _split(calls):
+    def sent_tokenize(text, language):
+        calls.append(text)
+        return [sentence + '.' for sentence in text.rstrip('.').split('. ')]
+    return sent_tokenize
+
+
+def test_text_to_show_is_built_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(PptxChecker, 'sent_tokenize', _split(calls))
+    problems, = TypographyChecker().find_problems([LONG_TEXT])
+    first = problems[0]['text_to_show']
+    for i in range(3):
+        for problem in problems:
+            problem['text_to_show']
+    assert first.endswith('\nПервое предложение о ценах - довольно длинное, чтобы его разбить.')
+    assert problems[-1]['text_to_show'].endswith('\nВторое предложение: цены 10-20 рублей, "много".')
+    assert calls == [LONG_TEXT]
+
+
+def test_calls_do_not_share_the_sentences():
+    checker = TypographyChecker()
+    first, = checker.find_problems(['Цены 10-20 рублей'])
+    second, = checker.find_problems(['Даты 1990-2000'])
+    assert first[0]._sentences is not second[0]._sentences
+    assert first[0]['text_to_show'].endswith('\nЦены 10-20 рублей')
+
+
+def test_manifest_saves_only_the_stored_fields(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(PptxChecker, 'sent_tokenize', _split(calls))
+    problems, = TypographyChecker().find_problems([LONG_TEXT])
+    problems[0]['choice'] = 0
+    manifest = CheckManifest(str(tmp_path / 'deck.check.json'))
+    manifest.record(LONG_TEXT, [TYPOGRAPHY_ASPECT], problems)
+    manifest.save()
+    assert calls == []
+    saved = CheckManifest(manifest.path).lookup(LONG_TEXT, [TYPOGRAPHY_ASPECT])
+    assert [problem.to_dict() for problem in saved] == [problem.to_dict()
+                                                        for problem in problems]
+    assert all('text_to_show' not in problem.to_dict() for problem in saved)
+    assert saved[0]['choice'] == 0
+
+
+def test_restored_problems_build_their_context(tmp_path):
+    from decks import make_deck
+    deck = str(make_deck(tmp_path / 'deck.pptx', [['Цены 10-20 рублей']]))
+    client = PptxChecker.SpellerClient('http://localhost/checkTexts')
+    manager = PptxChecker.AspectCheckerManager(PptxChecker.SpellChecker(client))
+    for run in range(2):
+        checker = PptxChecker.StreamingPptxChecker(deck)
+        manifest = CheckManifest.for_file(deck, manager.config_key())
+        manager.set_problems(checker, [TYPOGRAPHY_ASPECT], manifest)
+        manifest.save()
+        problem, = checker.problems_to_show()[0][0]
+        assert problem['text_to_show'].endswith('\nЦены 10-20 рублей')
+        assert problem['options'] == ['–', '-', 'Не исправлять']
@@ -0,0 +1,110 @@
+import pytest
+
+pptx = pytest.importorskip('pptx')
+from pptx.util import Inches, Pt
+
+from PptxChecker import Problem, PptxChecker
+
+
+def _problem(text, word, replacement):
+    problem = Problem(text.index(word), len(word), [replacement], 'spelling', word)
+    problem['choice'] = 0
+    return problem
+
+
+def _runs(paragraph):
+    return [(run.text, run.font.bold, run.font.size) for run in paragraph.runs]
+
+
+@pytest.fixture
+def deck(tmp_path):
+    presentation = pptx.Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    paragraph = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)) \
+        .text_frame.paragraphs[0]
+    for text, bold in (('Превет ', False), ('жырный', True), (' и обычный тикст', False)):
+        run = paragraph.add_run()
+        run.text = text
+        run.font.bold = bold
+        run.font.size = Pt(20)
+    paragraph = slide.shapes.add_textbox(Inches(1), Inches(2), Inches(4), Inches(1)) \
+        .text_frame.paragraphs[0]
+    paragraph.add_run().text = 'Перенос'
+    paragraph.add_line_break()
+    paragraph.add_run().text = 'строкки'
+    table = slide.shapes.add_table(1, 2, Inches(1), Inches(3), Inches(4), Inches(1)).table
+    table.cell(0, 0).text = 'Ячейка с ашибкой'
+    table.cell(0, 1).text = 'Верная ячейка'
+    slide.notes_slide.notes_text_frame.text = 'Заметки с ошибкаи'
+    path = tmp_path / 'deck.pptx'
+    presentation.save(str(path))
+    return str(path)
+
+
+def _corrected(deck, fast_save, make_problems):
+    checker = PptxChecker(deck, fast_save=fast_save)
+    texts = checker.texts_to_checker()
+    checker.set_texts_problems([make_problems(text) for text in texts])
+    checker.correct()
+    return pptx.Presentation(checker.corrected_path)
+
+
+def _fixes(text):
+    fixes = {'Превет': 'Привет', 'жырный': 'жирный', 'тикст': 'текст', 'ашибкой': 'ошибкой',
+             'ошибкаи': 'ошибками', 'строкки': 'строки'}
+    return [_problem(text, word, replacement) for word, replacement in fixes.items()
+            if word in text]
+
+
+@pytest.mark.parametrize('fast_save', [True, False])
+def test_corrections_keep_the_runs_and_formatting(deck, fast_save):
+    slide = _corrected(deck, fast_save, _fixes).slides[0]
+    assert _runs(slide.shapes[0].text_frame.paragraphs[0]) == [
+        ('Привет ', False, Pt(20)), ('жирный', True, Pt(20)), (' и обычный текст', False, Pt(20))]
+    assert slide.shapes[1].text_frame.text == 'Перенос\vстроки'
+    assert [run.text for run in slide.shapes[1].text_frame.paragraphs[0].runs] == \
+        ['Перенос', 'строки']
+    table = slide.shapes[2].table
+    assert (table.cell(0, 0).text, table.cell(0, 1).text) == \
+        ('Ячейка с ошибкой', 'Верная ячейка')
+    assert slide.notes_slide.notes_text_frame.text == 'Заметки с ошибками'
+
+
+def test_corrections_in_one_run_are_made_from_the_end(deck):
+    def problems(text):
+        if not text.startswith('Превет'):
+            return []
+        ## Replacements of other lengths: the later positions are not shifted
+        return [_problem(text, 'обычный', 'ОБЫЧНЫЙ ТЕКСТ,'), _problem(text, 'тикст', 'т')]
+    paragraph = _corrected(deck, True, problems).slides[0].shapes[0].text_frame.paragraphs[0]
+    assert _runs(paragraph) == [('Превет ', False, Pt(20)), ('жырный', True, Pt(20)),
+                                (' и ОБЫЧНЫЙ ТЕКСТ, т', False, Pt(20))]
+
+
+def test_correction_of_several_runs_goes_to_the_first(deck):
+    def problems(text):
+        if not text.startswith('Превет'):
+            return []
+        return [_problem(text, 'ет жыр', 'ет жир')]
+    paragraph = _corrected(deck, True, problems).slides[0].shapes[0].text_frame.paragraphs[0]
+    assert _runs(paragraph) == [('Превет жир', False, Pt(20)), ('ный', True, Pt(20)),
+                                (' и обычный тикст', False, Pt(20))]
+
+
+def test_correction_of_a_line_break_replaces_the_whole_text(deck):
+    def problems(text):
+        if not text.startswith('Перенос'):
+            return []
+        return [_problem(text, 'нос\v', 'нос '), _problem(text, 'строкки', 'строки')]
+    shape = _corrected(deck, True, problems).slides[0].shapes[1]
+    assert shape.text_frame.text == 'Перенос строки'
+
+
+def test_correction_of_a_paragraph_end_replaces_the_whole_text(tmp_path):
+    presentation = pptx.Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text = 'ab\ncd'
+    path = str(tmp_path / 'deck.pptx')
+    presentation.save(path)
+    shape = _corrected(path, True, lambda text: [_problem(text, '\n', ' ')]).slides[0].shapes[0]
+    assert shape.text_frame.text == 'ab cd'
@@ -0,0 +1,37 @@
+import http.client
+import threading
+
+import pytest
+
+import PptxChecker
+
+
+def test_jsonl_is_rejected_with_serve():
+    with pytest.raises(SystemExit):
+        PptxChecker._parse_arguments(['--serve', '8765', '--jsonl', '-'])
+
+
+@pytest.fixture
+def service():
+    service = PptxChecker.CheckerService('127.0.0.1', 0, workers=1, queue_size=1)
+    thread = threading.Thread(target=service.serve_forever, daemon=True)
+    thread.start()
+    yield service
+    service.server.shutdown()
+    thread.join()
+
+
+def _post(service, body, headers=None):
+    connection = http.client.HTTPConnection(*service.server.server_address, timeout=10)
+    try:
+        connection.request('POST', '/check?aspects=typography', body, headers or {})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+def test_empty_body_is_a_bad_request(service):
+    assert _post(service, b'')[0] == 400
+    assert _post(service, None, {'Content-Length': '0'})[0] == 400
+    assert service.state()['accepted'] == 0
@@ -0,0 +1,30 @@
+from PptxChecker import SpellCache, SpellChecker
+
+
+class Client:
+    '''
+    Finds no problems and remembers the sent texts
+    '''
+    def __init__(self):
+        self.sent = []
+        
+    def cache_namespace(self):
+        return 'test'
+    
+    def check_batches(self, batches):
+        texts = [text for batch in batches for text in batch]
+        self.sent += texts
+        return [[] for text in texts]
+
+
+def test_texts_blank_after_masking_are_not_counted(tmp_path):
+    cache = SpellCache(str(tmp_path / 'cache.sqlite'))
+    client = Client()
+    spell_checker = SpellChecker(client, cache)
+    texts = ['Первый текст', '2024', 'https://example.com', ' ', 'Второй текст']
+    spell_checker.find_problems(texts)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert sorted(client.sent) == ['Второй текст', 'Первый текст']
+    spell_checker.find_problems(texts)
+    assert (cache.hits, cache.misses) == (2, 2)
+    assert len(client.sent) == 2
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from PptxChecker import SpellerClient
+
+
+class Response:
+    status_code = 200
+    content = b'[]'
+    
+    def __init__(self, texts):
+        self.texts = texts
+        
+    def raise_for_status(self):
+        pass
+    
+    def json(self):
+        return [[] for text in self.texts]
+
+
+class Session:
+    '''
+    Answers after a delay and remembers the largest number of requests at once
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.largest = 0
+        
+    def post(self, url, data, timeout):
+        with self.lock:
+            self.current += 1
+            self.largest = max(self.largest, self.current)
+        time.sleep(0.01)
+        with self.lock:
+            self.current -= 1
+        return Response(data['text'])
+
+
+class FakeClient(SpellerClient):
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.session = Session()
+        
+    def _session(self):
+        return self.session
+
+
+def test_max_in_flight_is_shared_by_the_threads():
+    client = FakeClient(max_in_flight=3)
+    batches = [['текст {}'.format(i)] for i in range(12)]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.check_batches(batches)))
+               for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [[[]] * 12] * 4
+    assert client.session.largest == 3
+    assert client.in_flight == 0
@@ -0,0 +1,83 @@
+import pytest
+
+from decks import make_deck
+
+import PptxChecker
+
+
+def test_texts_are_read_as_they_are_taken(tmp_path):
+    slides = [['Слайд {} текст {}'.format(i, j) for j in range(3)] for i in range(20)]
+    checker = PptxChecker.StreamingPptxChecker(str(make_deck(tmp_path / 'deck.pptx', slides)))
+    texts = checker.iter_texts_to_checker()
+    assert next(texts) == 'Слайд 0 текст 0'
+    assert len(checker.text_locations()) < 60
+    assert checker.texts_to_checker() == [text for slide in slides for text in slide]
+    assert list(texts) == checker.texts_to_checker()[1:]
+
+
+def test_problems_are_checked_by_chunks_of_the_stream(tmp_path):
+    slides = [['Цены 10-20 рублей - "много"'] * 5 for i in range(10)]
+    checker = PptxChecker.StreamingPptxChecker(str(make_deck(tmp_path / 'deck.pptx', slides)))
+    manager = PptxChecker.AspectCheckerManager(PptxChecker.SpellChecker(object()))
+    problems = manager.iter_problems(checker.iter_texts_to_checker(),
+                                     [PptxChecker.TYPOGRAPHY_ASPECT], chunk_size=4)
+    first = next(problems)
+    assert [problem['type'] for problem in first] == ['dash_between_digits',
+                                                      'hypher_between_spaces',
+                                                      'quotation_type', 'quotation_type']
+    assert len(checker.text_locations()) == 4
+    assert len(list(problems)) == 49
+
+
+def test_streaming_checker_does_not_correct():
+    assert not hasattr(PptxChecker.StreamingPptxChecker, 'correct')
+    assert hasattr(PptxChecker.PptxChecker, 'correct')
+
+
+def test_shapes_without_text_body_are_counted(tmp_path):
+    deck = str(make_deck(tmp_path / 'deck.pptx', [['Первый', None, 'Третий']]))
+    checker = PptxChecker.StreamingPptxChecker(deck)
+    assert checker.texts_to_checker() == ['Первый', '', 'Третий']
+    assert [location['shape_id'] for location in checker.text_locations()] == [2, 3, 4]
+
+
+def test_locations_are_the_same_as_in_python_pptx(tmp_path):
+    pptx = pytest.importorskip('pptx')
+    from pptx.util import Inches
+    presentation = pptx.Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[5])
+    slide.shapes.title.text = 'Заголовок'
+    empty = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(2), Inches(1))
+    empty._element.remove(empty._element.txBody)
+    slide.shapes.add_textbox(Inches(1), Inches(3), Inches(2), Inches(1)).text = 'Текст'
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(4), Inches(4), Inches(1)).table
+    table.cell(1, 1).text = 'Ячейка'
+    slide.notes_slide.notes_text_frame.text = 'Заметки'
+    path = str(tmp_path / 'deck.pptx')
+    presentation.save(path)
+    full = PptxChecker.PptxChecker(path)
+    streaming = PptxChecker.StreamingPptxChecker(path)
+    assert empty.shape_id in [location.get('shape_id') for location in full.text_locations()]
+    assert streaming.texts_to_checker() == full.texts_to_checker()
+    assert streaming.text_locations() == full.text_locations()
+
+
+def test_shapes_without_geometry_are_read_by_python_pptx(tmp_path):
+    pptx = pytest.importorskip('pptx')
+    from pptx.enum.shapes import MSO_SHAPE
+    from pptx.util import Inches
+    presentation = pptx.Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    shape = slide.shapes.add_shape(MSO_SHAPE.RECTANGLE, Inches(1), Inches(1), Inches(2),
+                                   Inches(1))
+    shape.text = 'Без геометрии'
+    shape._element.spPr.remove(shape._element.spPr.prstGeom)
+    group = slide.shapes.add_group_shape()
+    group.shapes.add_textbox(Inches(1), Inches(3), Inches(2), Inches(1)).text = 'В группе'
+    path = str(tmp_path / 'deck.pptx')
+    presentation.save(path)
+    full = PptxChecker.PptxChecker(path)
+    assert full.texts_to_checker() == ['Без геометрии', 'В группе']
+    streaming = PptxChecker.StreamingPptxChecker(path)
+    assert streaming.texts_to_checker() == full.texts_to_checker()
+    assert streaming.text_locations() == full.text_locations()
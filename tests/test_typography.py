@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from PptxChecker import TypographyChecker
+
+ALPHABET = ['а', 'б', ' ', '-', ' - ', '"', '«', '»', '„', '“', '1', '2', '.', '\n', '\x00']
+
+
+def _random_texts(seed, count):
+    generator = random.Random(seed)
+    return [''.join(generator.choice(ALPHABET) for i in range(generator.randrange(0, 30)))
+            for j in range(count)]
+
+
+def _found(checker, texts):
+    return [[problem.to_dict() for problem in problems]
+            for problems in checker.find_problems(texts)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_batched_scan_finds_the_same_problems(seed):
+    texts = _random_texts(seed, 50)
+    if seed % 2:
+        texts = [text.replace(TypographyChecker.SEPARATOR, '') for text in texts]
+    assert _found(TypographyChecker(batched=True), texts) == \
+        _found(TypographyChecker(batched=False), texts)
+
+
+def test_problems_are_mapped_to_their_texts():
+    texts = ['Цены 10-20', '', 'Он сказал "да"', 'Слово - слово']
+    found = TypographyChecker().find_problems(texts)
+    assert [[problem['type'] for problem in problems] for problems in found] == \
+        [['dash_between_digits'], [], ['quotation_type', 'quotation_type'],
+         ['hypher_between_spaces']]
+    assert [problem['pos'] for problem in found[2]] == [10, 13]